@@ -1,8 +1,12 @@
 import streamlit as st
-from PIL import Image
+from utils.embeddings import WARM_UP_EMBEDDINGS, start_warm_up
 
 def main():
     st.set_page_config(page_title='Multi-Functional AI Assistant', layout='wide')
+
+    # Load the shared embedding model in the background so the first document upload is fast
+    if WARM_UP_EMBEDDINGS:
+        start_warm_up()
     
     # Title with a gradient effect
     st.markdown(
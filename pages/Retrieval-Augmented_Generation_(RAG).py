@@ -1,35 +1,66 @@
+import uuid
+
 import streamlit as st
-import os
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
-from langchain import FAISS
-from pypdf import PdfReader
-from docx import Document
-from together import Together
-from dotenv import load_dotenv
+from utils.chat_history import ChatHistory, archive_path
+from utils.context import RAG_MAX_CHUNKS, context_token_budget, pack_context
+from utils.embeddings import embedding_stats, get_embeddings
+from utils.knowledge_base import get_knowledge_base, memory_report
+from utils.llm import DEFAULT_MODEL, complete, stream_complete
+from utils.ui import render_chat_history, render_llm_stats, render_stream
 
 # Initialize session state for conversation history
 def initialize_session_state():
     if 'history' not in st.session_state:
         st.session_state['history'] = []
-    
-    if 'generated' not in st.session_state:
-        st.session_state['generated'] = ["Hello! Ask me anything about your document 🤗"]
-    
-    if 'past' not in st.session_state:
-        st.session_state['past'] = ["Hello!!"]  # Initialize past
+
+    if 'session_id' not in st.session_state:
+        st.session_state['session_id'] = uuid.uuid4().hex
+
+    # Latest exchanges of this page, with older ones archived (see utils.chat_history)
+    if 'rag_chat' not in st.session_state:
+        st.session_state['rag_chat'] = ChatHistory(
+            ("Hello!!", "Hello! Ask me anything about your document 🤗"),
+            archive_path=archive_path("rag", st.session_state['session_id']))
 
 
 # Function to handle chat between the user and the model
 def conversation_chat(query, knowledgebase):
-    result = answer_query_from_document(query, knowledgebase)
+    display_user_message(query)
+
+    # Stream the answer into the chat as it is generated
+    result = render_stream(answer_query_from_document(query, knowledgebase, stream=True), display_ai_message)
     
-    # Append the query and result to session state
-    st.session_state['past'].append(query)  # Add query to past
-    st.session_state['generated'].append(result)  # Add result to generated
+    # Append the query and result to the conversation
+    st.session_state['rag_chat'].append(query, result)
     
     return result
 
+# Function to display a message sent by the user
+def display_user_message(message):
+    st.markdown(f"""
+            <div style="display: flex; justify-content: flex-end; margin-bottom: 10px;">
+                <div style="max-width: 70%; background-color: #262730; padding: 10px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);">
+                    {message}
+                </div>
+                <div style="border-radius: 50%; background-color: #262730; width: 40px; height: 40px; display: flex; align-items: center; justify-content: center; margin-left: 10px;">
+                    🧑‍💼
+                </div>
+            </div>
+        """, unsafe_allow_html=True)
+
+# Function to display a message generated by the model
+def display_ai_message(message):
+    st.markdown(f"""
+            <div style="display: flex; justify-content: flex-start; margin-bottom: 10px;">
+                <div style="border-radius: 50%; background-color: #262730; width: 40px; height: 40px; display: flex; align-items: center; justify-content: center; margin-right: 10px;">
+                    🤖
+                </div>
+                <div style="max-width: 70%; background-color: #262730; padding: 10px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);">
+                    {message}
+                </div>
+            </div>
+        """, unsafe_allow_html=True)
+
 # Function to display the chat interface
 def display_chat_history(knowledgebase):
     reply_container = st.container()
@@ -40,37 +71,15 @@ def display_chat_history(knowledgebase):
             user_input = st.text_input("Ask a Question", placeholder="Ask about your document", key='input')
             submit_button = st.form_submit_button(label='Send')
 
+    with reply_container:
+        # Only the latest messages are drawn; earlier ones are loaded on request
+        render_chat_history(st.session_state['rag_chat'], display_user_message, display_ai_message, 'rag_chat')
+
+        # The new answer is streamed below the existing conversation as it is generated
         if submit_button and user_input:
             with st.spinner('Generating response...'):
                 output = conversation_chat(user_input, knowledgebase)
 
-    if st.session_state['generated']:
-        with reply_container:
-            # Get the number of messages to display, based on the length of the shorter list
-            num_messages = min(len(st.session_state['generated']), len(st.session_state['past']))
-            
-            for i in range(num_messages):
-                st.markdown(f"""
-                        <div style="display: flex; justify-content: flex-end; margin-bottom: 10px;">
-                            <div style="max-width: 70%; background-color: #262730; padding: 10px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);">
-                                {st.session_state['past'][i]}
-                            </div>
-                            <div style="border-radius: 50%; background-color: #262730; width: 40px; height: 40px; display: flex; align-items: center; justify-content: center; margin-left: 10px;">
-                                🧑‍💼
-                            </div>
-                        </div>
-                    """, unsafe_allow_html=True)
-                st.markdown(f"""
-                        <div style="display: flex; justify-content: flex-start; margin-bottom: 10px;">
-                            <div style="border-radius: 50%; background-color: #262730; width: 40px; height: 40px; display: flex; align-items: center; justify-content: center; margin-right: 10px;">
-                                🤖
-                            </div>
-                            <div style="max-width: 70%; background-color: #262730; padding: 10px; border-radius: 10px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);">
-                                {st.session_state['generated'][i]}
-                            </div>
-                        </div>
-                    """, unsafe_allow_html=True)
-
 
 # Main function to handle document upload and start conversation
 def main():
@@ -83,93 +92,99 @@ def main():
     uploaded_file = st.file_uploader('Upload your Document', type=['pdf', 'docx', 'txt'])
     
     if uploaded_file:
-        # Extract text from the uploaded file based on its type
-        text = extract_text_from_file(uploaded_file)
-        
-        # Process the text to create the knowledgebase (embeddings + FAISS index)
-        knowledgebase = process_text(text)
-        
-        # Initialize session state and start conversation
+        # Look up the knowledgebase (embeddings + FAISS index) by the document's content;
+        # a new document is extracted, chunked and embedded in the background
         initialize_session_state()
+        knowledgebase = get_knowledge_base(uploaded_file.getvalue(), uploaded_file.name, st.session_state['session_id'])
+
+        # Questions can be asked as soon as the first sections are indexed
+        with st.spinner('Reading document...'):
+            knowledgebase.wait_until_searchable()
+
+        if knowledgebase.error:
+            st.error(f"Could not process the document: {knowledgebase.error}")
+            return
+        if knowledgebase.complete and knowledgebase.chunk_count == 0:
+            st.warning("No text could be extracted from this document.")
+            return
+        if not knowledgebase.complete:
+            st.info(f"Still indexing the document ({knowledgebase.chunk_count} sections so far). Answers are based on the part indexed so far.")
+        
+        # Start conversation
         display_chat_history(knowledgebase)
-
-# Function to extract text from different document types
-def extract_text_from_file(uploaded_file):
-    file_extension = uploaded_file.name.split('.')[-1].lower()
-    if file_extension == "pdf":
-        return extract_text_from_pdf(uploaded_file)
-    elif file_extension == "docx":
-        return extract_text_from_docx(uploaded_file)
-    elif file_extension == "txt":
-        return extract_text_from_txt(uploaded_file)
+        display_answer_cache_stats(knowledgebase)
+        display_memory_usage()
+        display_embedding_stats()
+        render_llm_stats()
+
+# Function to show the memory used by this session's documents and by every session
+def display_memory_usage():
+    report = memory_report()
+    megabyte = 2 ** 20
+    st.sidebar.subheader("Memory")
+    st.sidebar.write(f"This session: {report['sessions'].get(st.session_state['session_id'], 0) / megabyte:.1f} MB")
+    st.sidebar.write(f"All sessions: {report['private_bytes'] / megabyte:.1f} MB of {report['budget_bytes'] / megabyte:.0f} MB "
+                     f"for {report['knowledge_bases']} documents, plus {report['mapped_bytes'] / megabyte:.1f} MB "
+                     f"of memory-mapped indexes ({report['released']} released to disk until used again)")
+
+# Function to show how long the embedding model took to load, the memory it added and
+# how well embedding requests are batched and cached
+def display_embedding_stats():
+    stats = embedding_stats()
+    megabyte = 2 ** 20
+    st.sidebar.subheader("Embedding Model")
+    if stats["loaded"]:
+        st.sidebar.write(f"{stats['model']}: loaded in {stats['load_seconds']:.1f} s, "
+                         f"+{stats['load_memory_bytes'] / megabyte:.0f} MB resident")
     else:
-        st.warning(f"Unsupported file type: {file_extension}")
-        return ""
-
-# Function to extract text from a PDF file
-def extract_text_from_pdf(pdf_file):
-    text = ""
-    pdf_reader = PdfReader(pdf_file)
-    for page in pdf_reader.pages:
-        text += page.extract_text() or ''
-    return text
-
-# Function to extract text from a DOCX file
-def extract_text_from_docx(docx_file):
-    text = ""
-    doc = Document(docx_file)
-    for paragraph in doc.paragraphs:
-        text += paragraph.text + '\n'
-    return text
-
-# Function to extract text from a TXT file
-def extract_text_from_txt(txt_file):
-    text = txt_file.read().decode('utf-8')
-    return text
-
-def process_text(text):
-    # Split the text into smaller chunks for embedding
-    text_splitter = CharacterTextSplitter(
-        separator="\n",
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    chunks = text_splitter.split_text(text)
-
-    # Create embeddings for each chunk using HuggingFace BGE embeddings
-    embeddings = HuggingFaceBgeEmbeddings(model_name='sentence-transformers/all-MiniLM-L6-v2')
-
-    # Store the chunks and their embeddings in a FAISS index
-    knowledgebase = FAISS.from_texts(chunks, embeddings)
-
-    return knowledgebase
-
-def answer_query_from_document(query, knowledgebase):
+        st.sidebar.write(f"{stats['model']}: not loaded yet")
+    st.sidebar.write(f"Process memory: {stats['resident_memory_bytes'] / megabyte:.0f} MB")
+    if stats.get("batching", {}).get("batches"):
+        st.sidebar.write(f"Average batch: {stats['batching']['average_batch_size']:.1f} texts")
+    cache = stats.get("cache")
+    if cache and cache["hits"] + cache["misses"]:
+        st.sidebar.write(f"Embedding cache: {cache['hits'] / (cache['hits'] + cache['misses']):.0%} hits, "
+                         f"{cache['entries']} vectors")
+
+# Function to show how often earlier answers are reused, with sampled reuses to check
+# that the similarity threshold is not too loose
+def display_answer_cache_stats(knowledgebase):
+    stats = knowledgebase.answer_cache.stats()
+    if not stats["lookups"]:
+        return
+    st.sidebar.subheader("Answer Cache")
+    st.sidebar.write(f"Answered from cache: {stats['hit_rate']:.0%} of {stats['lookups']} questions")
+    if stats["samples"]:
+        with st.sidebar.expander("Sampled cache hits"):
+            for sample in reversed(stats["samples"]):
+                st.write(f"**{sample['query']}** reused the answer to **{sample['cached_query']}** "
+                         f"(similarity {sample['similarity']:.2f})")
+
+def answer_query_from_document(query, knowledgebase, stream=False):
     # Perform a similarity search to find the most relevant chunks for the given query
-    docs = knowledgebase.similarity_search(query, k=3)  # Retrieve top 3 relevant chunks
+    vector = get_embeddings().embed_query(query)
+    docs_and_scores = knowledgebase.similarity_search_with_score_by_vector(vector, k=RAG_MAX_CHUNKS)
 
-    # Combine the retrieved chunks into a context for the LLM
-    context = "\n\n".join([doc.page_content for doc in docs])
+    # Combine the most relevant chunks into a context for the LLM, merging the text that
+    # neighbouring chunks share and stopping at the model's context token budget
+    context, docs = pack_context(docs_and_scores, context_token_budget(DEFAULT_MODEL))
+
+    # Reuse the answer of an earlier question phrased alike that retrieved the same chunks
+    chunk_ids = [doc.metadata.get("chunk_id", doc.page_content) for doc in docs]
+    answer = knowledgebase.answer_cache.get(query, vector, chunk_ids)
+    if answer is not None:
+        return iter([answer]) if stream else answer
 
     # Prepare the prompt for LLM, providing context to answer the query
     prompt = f"Answer the following question based on the provided context:\n\n{context}\n\nQuestion: {query}"
 
-    # Load environment variables
-    load_dotenv()
-    TOGETHER_AI_API = os.getenv("TOGETHER_AI_API_KEY")
-
-    # Initialize Together API client
-    client = Together(api_key=TOGETHER_AI_API)
-
-    # Send the prompt to the Llama 3.3 model for generating an answer
-    response = client.chat.completions.create(
-        model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
-        messages=[{"role": "user", "content": prompt}]
-    )
-
-    # Return the response generated by the model
-    return response.choices[0].message.content
+    # Send the prompt to the Llama 3.3 model for generating an answer,
+    # either as a token stream for the chat UI or as the complete text
+    if stream:
+        return knowledgebase.answer_cache.record_stream(query, vector, chunk_ids, stream_complete(prompt))
+    answer = complete(prompt)
+    knowledgebase.answer_cache.put(query, vector, chunk_ids, answer)
+    return answer
 
 if __name__ == '__main__':
     main()
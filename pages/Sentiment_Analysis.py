@@ -1,7 +1,7 @@
 import streamlit as st
-import os
-from dotenv import load_dotenv
-from together import Together
+from collections import Counter
+from utils.sentiment_classifier import cascade_stats, classify_sentiment, classify_sentiment_bulk
+from utils.ui import render_llm_stats
 
 def main():
     st.set_page_config(page_title='Sentiment Analyzer')
@@ -16,41 +16,64 @@ def main():
     submit = st.button('Analyze Sentiment')
 
     if submit:
-        sentiment = analyze_sentiment(input_text)
+        # Confident predictions come from the local classifier; the rest go to the LLM
+        sentiment, tier = classify_sentiment(input_text)
         st.subheader('Sentiment: \n')
         st.write(sentiment)
+        if tier:
+            st.caption("Classified locally" if tier == "local" else "Classified by the LLM")
 
-def analyze_sentiment(text):
-    if text:
-        # Load environment variables for API key
-        load_dotenv()
-        TOGETHER_AI_API = os.getenv("TOGETHER_AI_API_KEY")
+    st.divider()
+    bulk_sentiment_analysis()
 
-        # Initialize Together API client
-        client = Together(api_key=TOGETHER_AI_API)
+    # Share of texts the local classifier could not answer, and the latency of each tier
+    stats = cascade_stats()
+    if stats["texts"]:
+        st.sidebar.subheader("Classifier Statistics")
+        st.sidebar.write(f"Escalated to the LLM: {stats['escalation_rate']:.0%} of {stats['texts']} texts")
+        if stats["local_ms_per_text"] is not None:
+            st.sidebar.write(f"Local classifier: {stats['local_ms_per_text']:.1f} ms per text")
+        if stats["llm_ms_per_text"] is not None:
+            st.sidebar.write(f"LLM: {stats['llm_ms_per_text']:.0f} ms per text")
+    render_llm_stats()
 
-        # Query for sentiment analysis
-        query = f'''You are a sentiment analysis expert. Your task is to analyze the following text and classify its overall sentiment.
+# Function to read an uploaded CSV or JSONL file into a table
+def read_table(uploaded_file):
+    import pandas as pd
+    if uploaded_file.name.lower().endswith('.csv'):
+        return pd.read_csv(uploaded_file)
+    return pd.read_json(uploaded_file, lines=True)
 
-        Instructions:
-        1. Read the provided text carefully.
-        2. Identify the dominant emotional tone.
-        3. Classify the sentiment as either positive, negative, or neutral.
-        4. **Provide only the sentiment classification (positive, negative, or neutral) without any additional explanation or analysis.**
+# Bulk mode: classify a whole column of a CSV/JSONL file
+def bulk_sentiment_analysis():
+    st.subheader('Bulk Sentiment Analysis')
+    uploaded_file = st.file_uploader("Upload a CSV or JSONL file", type=["csv", "jsonl"])
+    if not uploaded_file:
+        return
 
-        Text: {text}
+    table = read_table(uploaded_file)
+    column = st.selectbox("Column containing the texts", list(table.columns))
 
-        Sentiment: '''
+    if st.button('Analyze All'):
+        texts = table[column].fillna('').astype(str).tolist()
+        labels = [None] * len(texts)
+        counts = Counter()
+        progress_bar = st.progress(0.0, text="Classifying...")
+        counts_placeholder = st.empty()
 
-        # Send the query to the Llama model for sentiment classification
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
-            messages=[{"role": "user", "content": query}]
-        )
+        # Results arrive batch by batch; show progress and running counts as they do
+        for done, (index, label, tier) in enumerate(classify_sentiment_bulk(texts), start=1):
+            labels[index] = label
+            counts[label or 'unclassified'] += 1
+            if done % 50 == 0 or done == len(texts):
+                progress_bar.progress(done / len(texts), text=f"Classified {done}/{len(texts)} texts")
+                counts_placeholder.write(dict(counts))
 
-        # Parse and return the sentiment result
-        sentiment = response.choices[0].message.content.strip()
-        return sentiment
+        table['sentiment'] = labels
+        progress_bar.empty()
+        st.dataframe(table)
+        st.download_button("Download Results (CSV)", table.to_csv(index=False).encode('utf-8'),
+                           file_name="sentiment_results.csv", mime="text/csv")
 
 if __name__ == '__main__':
     main()
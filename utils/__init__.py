@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Load environment variables (API keys and optional settings) once per process
+load_dotenv()
@@ -0,0 +1,179 @@
+import argparse
+import math
+import os
+import re
+import time
+
+import faiss
+import numpy as np
+
+# FAISS index factory string used for every knowledge base, e.g. "HNSW32" (empty picks one by size)
+KB_INDEX_FACTORY = os.getenv("KB_INDEX_FACTORY", "")
+
+# Knowledge bases with at least this many chunks use HNSW over float16 vectors, and
+# from KB_IVF_MIN_VECTORS an inverted file over quantized vectors
+KB_HNSW_MIN_VECTORS = int(os.getenv("KB_HNSW_MIN_VECTORS", "50000"))
+KB_IVF_MIN_VECTORS = int(os.getenv("KB_IVF_MIN_VECTORS", "1000000"))
+
+# HNSW graph degree and search breadth (higher is more accurate and slower)
+KB_HNSW_M = int(os.getenv("KB_HNSW_M", "32"))
+KB_HNSW_EF_CONSTRUCTION = int(os.getenv("KB_HNSW_EF_CONSTRUCTION", "80"))
+KB_HNSW_EF_SEARCH = int(os.getenv("KB_HNSW_EF_SEARCH", "64"))
+
+# IVF lists probed per search and vectors used for training
+KB_IVF_NPROBE = int(os.getenv("KB_IVF_NPROBE", "16"))
+KB_IVF_TRAIN_SIZE = int(os.getenv("KB_IVF_TRAIN_SIZE", "200000"))
+
+# How IVF stores vectors: SQ8 takes 1 byte per dimension and keeps recall close to exact;
+# product quantization such as PQ48 (48 bytes per vector) fits 8x more vectors in the same
+# RAM at a large cost in recall. Compare them with `python -m utils.ann_index`.
+KB_IVF_CODES = os.getenv("KB_IVF_CODES", "SQ8")
+
+# Vectors added to a new index at a time
+_ADD_BATCH = 65536
+
+# Training vectors per IVF list below which faiss warns that the clustering is unreliable
+_MIN_POINTS_PER_LIST = 39
+
+
+# Function to choose the index type of a corpus from its size. An IVF index configured in
+# KB_INDEX_FACTORY gets fewer lists when the corpus is too small to train them.
+def index_factory_for(count):
+    if KB_INDEX_FACTORY:
+        match = re.match(r"IVF(\d+)", KB_INDEX_FACTORY)
+        if match and int(match.group(1)) > _max_lists(count):
+            return f"IVF{_max_lists(count)}" + KB_INDEX_FACTORY[match.end():]
+        return KB_INDEX_FACTORY
+    if count < KB_HNSW_MIN_VECTORS:
+        return "Flat"
+    if count < KB_IVF_MIN_VECTORS:
+        return f"HNSW{KB_HNSW_M},SQfp16"
+    return ivf_factory(count)
+
+
+def ivf_factory(count):
+    # About 4 * sqrt(n) lists, rounded to a power of two
+    nlist = 2 ** round(math.log2(4 * math.sqrt(max(1, count))))
+    return f"IVF{min(nlist, _max_lists(count))},{KB_IVF_CODES}"
+
+
+# Function to get the most IVF lists a corpus can train: a power of two with enough
+# vectors for each list, and never more lists than vectors
+def _max_lists(count):
+    return 2 ** int(math.log2(max(1, count // _MIN_POINTS_PER_LIST)))
+
+
+# Function to apply the search parameters to an index; parameters an index does not have are skipped
+def configure_index(index, nprobe=KB_IVF_NPROBE, ef_search=KB_HNSW_EF_SEARCH):
+    parameters = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            parameters.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+    return index
+
+
+# Function to build an index of the given factory type from float32 vectors
+def build_index(vectors, factory):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efConstruction = KB_HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > KB_IVF_TRAIN_SIZE:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), KB_IVF_TRAIN_SIZE, replace=False)]
+        index.train(sample)
+    for start in range(0, len(vectors), _ADD_BATCH):
+        index.add(vectors[start:start + _ADD_BATCH])
+    return configure_index(index)
+
+
+# Function to rebuild a flat index as the index type suited to its size. Returns the new
+# index, or None when the flat index is already the right choice. Vectors keep their
+# positions, so the ids of the chunk store stay valid.
+def optimize_index(index):
+    factory = index_factory_for(index.ntotal)
+    if factory == "Flat" or not isinstance(index, faiss.IndexFlat):
+        return None
+    return build_index(index.reconstruct_n(0, index.ntotal), factory)
+
+
+def index_memory_bytes(index):
+    return faiss.serialize_index(index).nbytes
+
+
+# Function to compare index types with the exact flat index on the same vectors:
+# recall@k of each against the flat results, search latency per query and memory
+def recall_report(vectors, queries, factories, k=4):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    flat = build_index(vectors, "Flat")
+    _, truth = flat.search(queries, k)
+
+    rows = []
+    for factory in ["Flat"] + [factory for factory in factories if factory != "Flat"]:
+        start = time.perf_counter()
+        index = flat if factory == "Flat" else build_index(vectors, factory)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        found = []
+        for query in queries:
+            start = time.perf_counter()
+            _, ids = index.search(query[None, :], k)
+            latencies.append(time.perf_counter() - start)
+            found.append(ids[0])
+        recall = np.mean([len(set(ids) & set(expected)) / k for ids, expected in zip(found, truth)])
+        latencies.sort()
+        rows.append({
+            "index": factory,
+            "recall": float(recall),
+            "p50_ms": 1000 * latencies[len(latencies) // 2],
+            "p99_ms": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            "memory_mb": index_memory_bytes(index) / 2 ** 20,
+            "build_seconds": build_seconds,
+        })
+    return rows
+
+
+def _synthetic_corpus(count, dimension, query_count):
+    # Clustered unit vectors, closer to sentence embeddings than uniform noise
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(max(1, count // 100), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.5 * rng.normal(size=(count, dimension)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    queries = vectors[rng.choice(count, query_count, replace=False)] + 0.1 * rng.normal(size=(query_count, dimension)).astype(np.float32)
+    faiss.normalize_L2(queries)
+    return vectors, queries
+
+
+# Print a recall-vs-latency report for the index types, on a saved knowledge base or synthetic vectors
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare FAISS index types with the exact flat index.")
+    parser.add_argument("--kb", help="directory of a saved knowledge base (with index.faiss); default: synthetic vectors")
+    parser.add_argument("--vectors", type=int, default=200000, help="number of synthetic vectors")
+    parser.add_argument("--dimension", type=int, default=384, help="dimension of the synthetic vectors")
+    parser.add_argument("--queries", type=int, default=500, help="number of queries")
+    parser.add_argument("-k", type=int, default=4, help="results per query")
+    parser.add_argument("--index", action="append",
+                        help="index factory string to compare (repeatable); default: the automatic tiers")
+    args = parser.parse_args()
+
+    if args.kb:
+        stored = faiss.read_index(os.path.join(args.kb, "index.faiss"))
+        vectors = stored.reconstruct_n(0, stored.ntotal)
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+        queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    else:
+        vectors, queries = _synthetic_corpus(args.vectors, args.dimension, args.queries)
+
+    dimension = vectors.shape[1]
+    factories = args.index or [f"HNSW{KB_HNSW_M},SQfp16", ivf_factory(len(vectors))]
+    print(f"{len(vectors)} vectors of dimension {dimension}, {len(queries)} queries, k={args.k}")
+    print(f"{'index':<24}{'recall':>8}{'p50 ms':>9}{'p99 ms':>9}{'MB':>9}{'build s':>9}")
+    for row in recall_report(vectors, queries, factories, args.k):
+        print(f"{row['index']:<24}{row['recall']:>8.3f}{row['p50_ms']:>9.3f}{row['p99_ms']:>9.3f}"
+              f"{row['memory_mb']:>9.1f}{row['build_seconds']:>9.1f}")
@@ -0,0 +1,100 @@
+import os
+import random
+import threading
+from collections import deque
+
+import faiss
+import numpy as np
+
+# Smallest cosine similarity between two questions for one to reuse the other's answer
+RAG_ANSWER_CACHE_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.92"))
+
+# Answers kept per document
+RAG_ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1000"))
+
+# Share of cache hits kept for review, to spot answers reused for a different question
+RAG_ANSWER_CACHE_SAMPLE_RATE = float(os.getenv("RAG_ANSWER_CACHE_SAMPLE_RATE", "0.1"))
+RAG_ANSWER_CACHE_MAX_SAMPLES = 50
+
+# Cached questions compared with each new question
+_CANDIDATES = 8
+
+
+def _normalized(vector):
+    vector = np.asarray([vector], dtype=np.float32)
+    faiss.normalize_L2(vector)
+    return vector
+
+
+# Answers to the questions asked about one document, found by question similarity. A
+# cached answer is reused only when the new question is close to the cached one and
+# retrieves exactly the same chunks, so the answer was generated from the same context.
+class SemanticAnswerCache:
+    def __init__(self, threshold=RAG_ANSWER_CACHE_THRESHOLD, max_entries=RAG_ANSWER_CACHE_SIZE,
+                 sample_rate=RAG_ANSWER_CACHE_SAMPLE_RATE):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.sample_rate = sample_rate
+        self._index = None
+        self._entries = []
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.samples = deque(maxlen=RAG_ANSWER_CACHE_MAX_SAMPLES)
+
+    # Function to find the cached answer of a question; returns None on a miss
+    def get(self, query, vector, chunk_ids):
+        chunk_ids = frozenset(chunk_ids)
+        with self._lock:
+            self.lookups += 1
+            if self._index is None or not self._entries:
+                return None
+            similarities, positions = self._index.search(_normalized(vector), min(_CANDIDATES, len(self._entries)))
+            for similarity, position in zip(similarities[0], positions[0]):
+                if similarity < self.threshold:
+                    break
+                cached_query, cached_chunk_ids, answer = self._entries[position]
+                if cached_chunk_ids == chunk_ids:
+                    self.hits += 1
+                    if random.random() < self.sample_rate:
+                        self.samples.append({"query": query, "cached_query": cached_query,
+                                             "similarity": float(similarity), "answer": answer})
+                    return answer
+        return None
+
+    def put(self, query, vector, chunk_ids, answer):
+        vector = _normalized(vector)
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vector.shape[1])
+            if len(self._entries) >= self.max_entries:
+                self._drop_oldest()
+            self._index.add(vector)
+            self._entries.append((query, frozenset(chunk_ids), answer))
+
+    def _drop_oldest(self):
+        # A flat index cannot drop single rows cheaply, so keep the newest half and rebuild
+        keep = len(self._entries) // 2
+        vectors = self._index.reconstruct_n(len(self._entries) - keep, keep)
+        self._entries = self._entries[-keep:]
+        self._index.reset()
+        self._index.add(vectors)
+
+    # Function to cache a streamed answer once it has been read to the end
+    def record_stream(self, query, vector, chunk_ids, stream):
+        parts = []
+        for text in stream:
+            parts.append(text)
+            yield text
+        self.put(query, vector, chunk_ids, "".join(parts))
+
+    # Function to report the hit rate and the sampled hits
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else None,
+                "samples": list(self.samples),
+            }
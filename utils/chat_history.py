@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+from collections import deque
+from itertools import islice
+
+# Question/answer exchanges kept in memory per chat page and session
+CHAT_HISTORY_MAX_EXCHANGES = int(os.getenv("CHAT_HISTORY_MAX_EXCHANGES", "100"))
+
+# Exchanges shown at first, and how many more each "Load earlier messages" shows
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "10"))
+
+# Directory where exchanges pushed out of memory are appended, one JSON Lines file per
+# page and session, so they can still be loaded (empty drops them)
+CHAT_HISTORY_ARCHIVE_DIR = os.getenv("CHAT_HISTORY_ARCHIVE_DIR", "")
+
+
+# Function to get the archive file of a chat page in a session, or None when archiving is off
+def archive_path(page, session_id):
+    if not CHAT_HISTORY_ARCHIVE_DIR:
+        return None
+    return os.path.join(CHAT_HISTORY_ARCHIVE_DIR, f"{page}-{session_id}.jsonl")
+
+
+# The conversation of a chat page after its greeting, a (user, assistant) message pair.
+# The latest exchanges are kept in a ring buffer, so the memory of a session does not
+# grow with the length of the conversation. Older exchanges are appended to an archive
+# file when there is one, and dropped otherwise.
+class ChatHistory:
+    def __init__(self, greeting, max_exchanges=CHAT_HISTORY_MAX_EXCHANGES, archive_path=None):
+        self.greeting = greeting
+        self.archive_path = archive_path
+        self.archived = 0
+        self._exchanges = deque(maxlen=max(1, max_exchanges))
+        self._lock = threading.Lock()
+
+    # Number of exchanges that can be shown, in memory and archived
+    def __len__(self):
+        return self.archived + len(self._exchanges)
+
+    def append(self, query, answer):
+        with self._lock:
+            if len(self._exchanges) == self._exchanges.maxlen and self.archive_path:
+                self._archive(self._exchanges[0])
+            self._exchanges.append((query, answer))
+
+    def _archive(self, exchange):
+        os.makedirs(os.path.dirname(self.archive_path) or ".", exist_ok=True)
+        with open(self.archive_path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(exchange) + "\n")
+        self.archived += 1
+
+    # Function to get the last `count` exchanges, oldest first. Only the exchanges asked
+    # for are read, from the archive when the count reaches past the ones in memory.
+    def latest(self, count):
+        with self._lock:
+            exchanges = list(islice(reversed(self._exchanges), count))[::-1]
+            missing = min(count - len(exchanges), self.archived)
+        if missing <= 0:
+            return exchanges
+        with open(self.archive_path, encoding="utf-8") as file:
+            archived = [tuple(json.loads(line)) for line in deque(file, maxlen=missing)]
+        return archived + exchanges
+
+    def clear(self):
+        with self._lock:
+            self._exchanges.clear()
+            if self.archived:
+                try:
+                    os.unlink(self.archive_path)
+                except OSError:
+                    pass
+            self.archived = 0
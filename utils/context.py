@@ -0,0 +1,83 @@
+import json
+import os
+
+from utils.llm import CONTEXT_WINDOWS, RESPONSE_TOKEN_RESERVE
+from utils.tokens import count_tokens
+
+# Tokens of retrieved text put in a RAG prompt, with per-model overrides,
+# e.g. RAG_CONTEXT_TOKEN_BUDGETS='{"Deepseek": 1000}'
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+RAG_CONTEXT_TOKEN_BUDGETS = json.loads(os.getenv("RAG_CONTEXT_TOKEN_BUDGETS", "{}"))
+
+# Chunks retrieved as candidates for the context
+RAG_MAX_CHUNKS = int(os.getenv("RAG_MAX_CHUNKS", "8"))
+
+# Chunks further from the question than this multiple of the best chunk's distance are left out
+RAG_MAX_DISTANCE_RATIO = float(os.getenv("RAG_MAX_DISTANCE_RATIO", "1.5"))
+
+# Tokens kept free for the instructions and the question
+_PROMPT_OVERHEAD_TOKENS = 512
+
+CONTEXT_SEPARATOR = "\n\n"
+
+
+# Function to get the context budget of a model, never more than its window allows
+def context_token_budget(model):
+    budget = RAG_CONTEXT_TOKEN_BUDGETS.get(model, RAG_CONTEXT_TOKEN_BUDGET)
+    return min(budget, CONTEXT_WINDOWS[model] - RESPONSE_TOKEN_RESERVE - _PROMPT_OVERHEAD_TOKENS)
+
+
+# Function to merge chunks (given best first) that overlap or touch in the document into
+# single spans, so the text they share appears once. Spans are returned best first, as
+# {"text", "start", "end", "rank"}; chunks without offsets are only deduplicated by text.
+def merge_spans(docs):
+    placed = sorted(
+        ((doc.metadata["start"], doc.metadata["end"], rank, doc.page_content)
+         for rank, doc in enumerate(docs) if "start" in doc.metadata and "end" in doc.metadata),
+        key=lambda chunk: (chunk[0], -chunk[1]),
+    )
+    spans = []
+    for start, end, rank, text in placed:
+        span = spans[-1] if spans else None
+        if span is None or start > span["end"] + 1:
+            spans.append({"text": text, "start": start, "end": end, "rank": rank})
+            continue
+        if end > span["end"]:
+            if start >= span["end"]:
+                # Adjacent chunks: the gap between them is the stripped separator
+                span["text"] += "\n" + text
+            else:
+                span["text"] += text[span["end"] - start:]
+            span["end"] = end
+        span["rank"] = min(span["rank"], rank)
+
+    seen = {span["text"] for span in spans}
+    for rank, doc in enumerate(docs):
+        if ("start" not in doc.metadata or "end" not in doc.metadata) and doc.page_content not in seen:
+            seen.add(doc.page_content)
+            spans.append({"text": doc.page_content, "start": None, "end": None, "rank": rank})
+    return sorted(spans, key=lambda span: span["rank"])
+
+
+def render_context(spans):
+    return CONTEXT_SEPARATOR.join(span["text"] for span in spans)
+
+
+# Function to build the context of a RAG prompt from (chunk, distance) pairs, best first.
+# Chunks are added in order of relevance while the merged context stays within
+# `token_budget` tokens, so the number of chunks adapts to their size and overlap.
+# Returns (context, chunks used).
+def pack_context(docs_and_scores, token_budget):
+    if not docs_and_scores:
+        return "", []
+    best_distance = docs_and_scores[0][1]
+
+    selected = []
+    for doc, distance in docs_and_scores:
+        if selected and distance > best_distance * RAG_MAX_DISTANCE_RATIO:
+            break
+        candidate = selected + [doc]
+        # The best chunk is always used, whatever the budget
+        if not selected or count_tokens(render_context(merge_spans(candidate))) <= token_budget:
+            selected = candidate
+    return render_context(merge_spans(selected)), selected
@@ -0,0 +1,373 @@
+import argparse
+import codecs
+import math
+import multiprocessing
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+SUPPORTED_EXTENSIONS = ("pdf", "docx", "txt")
+
+# Processes extracting PDF pages in parallel (1 disables parallel extraction)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+
+# PDFs with fewer pages are extracted in the calling thread
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+
+# Smallest page range handed to one worker; every worker parses the file once per range
+PDF_MIN_PAGES_PER_SHARD = int(os.getenv("PDF_MIN_PAGES_PER_SHARD", "8"))
+
+# Bytes of a TXT file decoded at a time
+TXT_BLOCK_SIZE = 1 << 20
+
+
+class UnsupportedFileType(ValueError):
+    pass
+
+
+def file_extension(file_name):
+    return file_name.split('.')[-1].lower()
+
+
+# Function to stream the text of a PDF file page by page, as (page number, text)
+def iter_pdf_pages(pdf_file):
+    from pypdf import PdfReader
+    pdf_reader = PdfReader(pdf_file)
+    for page_number, page in enumerate(pdf_reader.pages, start=1):
+        yield page_number, page.extract_text() or ''
+
+
+# Function to extract a range of pages in a worker process, which opens the file itself
+def _extract_pdf_range(path, start, stop):
+    from pypdf import PdfReader
+    pdf_reader = PdfReader(path)
+    return [(page_number + 1, pdf_reader.pages[page_number].extract_text() or '') for page_number in range(start, stop)]
+
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # Spawned workers only import this module, and never inherit the threads of the app
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+
+# Function to stream the text of a PDF file page by page, extracting page ranges in
+# parallel on a process pool. Pages are yielded in order as soon as their range is done.
+# Only about two ranges per worker are extracted ahead of the caller, so the text of a
+# large document does not pile up when the caller (e.g. embedding) is slower.
+def iter_pdf_pages_parallel(pdf_file, workers=PDF_EXTRACT_WORKERS):
+    from pypdf import PdfReader
+    # Workers open the document from a temporary file rather than receiving its bytes
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        shutil.copyfileobj(pdf_file, tmp, TXT_BLOCK_SIZE)
+        path = tmp.name
+
+    futures = deque()
+    try:
+        page_count = len(PdfReader(path).pages)
+        if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+            yield from iter_pdf_pages(path)
+            return
+
+        # About four ranges per worker, so a slow range does not leave the others idle
+        pages_per_shard = max(PDF_MIN_PAGES_PER_SHARD, math.ceil(page_count / (workers * 4)))
+        pool = _get_pdf_pool()
+        for start in range(0, page_count, pages_per_shard):
+            futures.append(pool.submit(_extract_pdf_range, path, start, min(start + pages_per_shard, page_count)))
+            if len(futures) < workers * 2:
+                continue
+            yield from futures.popleft().result()
+        while futures:
+            yield from futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
+        # Workers read the whole file when they open it, so it can go once the ranges are done
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+_RELATIONSHIPS = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+# Elements whose paragraphs and tables are the top-level blocks of a part
+_BLOCK_CONTAINERS = ("body", "footnote", "endnote", "hdr", "ftr")
+
+# Parts of a DOCX file read after the body, by relationship type
+_DOCX_PART_TYPES = ("footnotes", "endnotes", "header", "footer")
+
+
+def _resolve_part(source, target):
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source), target))
+
+
+def _relationships(archive, part):
+    rels = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+    if rels not in archive.namelist():
+        return []
+    with archive.open(rels) as file:
+        return [(element.get("Type", "").rsplit("/", 1)[-1], _resolve_part(part, element.get("Target", "")))
+                for element in ElementTree.parse(file).getroot().iter(_RELATIONSHIPS)
+                if element.get("TargetMode") != "External"]
+
+
+# Function to list the text parts of a DOCX file in reading order, as (kind, path in the zip):
+# the body, then footnotes, endnotes, headers and footers
+def docx_parts(archive):
+    body = next((target for kind, target in _relationships(archive, "") if kind == "officeDocument"),
+                "word/document.xml")
+    related = _relationships(archive, body)
+    parts = [("document", body)]
+    for part_type in _DOCX_PART_TYPES:
+        parts += [(kind, target) for kind, target in related if kind == part_type and target in archive.namelist()]
+    return parts
+
+
+# Function to stream the paragraphs and table cells of one part of a DOCX file with an
+# incremental parser. Every finished paragraph is dropped from the tree, so memory does not
+# grow with the size of the part. Yields {"part", "kind", "paragraph", "table", "row",
+# "column", "text"}: "paragraph" counts the part's top-level paragraphs and tables, and
+# cells ("kind": "cell") also carry the index of their table in the part and their row and column.
+def _iter_docx_part(file, part):
+    stack = []
+    # Open tables, innermost last, as [table index, row, column, paragraphs of the open cell]
+    tables = []
+    table_count = 0
+    block = -1
+    fallback_depth = 0
+    w = None
+
+    for event, element in ElementTree.iterparse(file, events=("start", "end")):
+        tag = element.tag
+        if w is None:
+            # Transitional and strict documents use different namespaces
+            w = tag[:tag.index("}") + 1]
+            text_tags = _text_tags(w)
+        # WordprocessingML elements by local name, everything else by full tag
+        name = tag[len(w):] if tag.startswith(w) else tag
+        if event == "start":
+            if name in ("p", "tbl") and stack and stack[-1].tag[len(w):] in _BLOCK_CONTAINERS:
+                block += 1
+            if name == "tbl":
+                tables.append([table_count, -1, -1, []])
+                table_count += 1
+            elif name == "tr" and tables:
+                tables[-1][1] += 1
+                tables[-1][2] = -1
+            elif name == "tc" and tables:
+                tables[-1][2] += 1
+                tables[-1][3] = []
+            elif name == _FALLBACK:
+                # The fallback repeats the content of the preferred choice for older readers
+                fallback_depth += 1
+            stack.append(element)
+            continue
+
+        stack.pop()
+        if name == "p":
+            if not fallback_depth:
+                text = _paragraph_text(element, text_tags)
+                if tables:
+                    tables[-1][3].append(text)
+                else:
+                    yield {"part": part, "kind": "paragraph", "paragraph": block, "text": text}
+        elif name == "tc" and tables:
+            table, row, column, paragraphs = tables[-1]
+            if not fallback_depth:
+                yield {"part": part, "kind": "cell", "paragraph": block, "table": table, "row": row,
+                       "column": column, "text": "\n".join(paragraphs).strip("\n")}
+        elif name == "tr":
+            pass
+        elif name == "tbl" and tables:
+            tables.pop()
+        elif name == _FALLBACK:
+            fallback_depth -= 1
+        else:
+            continue
+        element.clear()
+        if stack:
+            stack[-1].remove(element)
+
+
+# Function to map the tags of paragraph content to their text: None for text runs, whose
+# text is their own, or the character a tab, break or hyphen stands for
+def _text_tags(w):
+    return {w + "t": None, w + "tab": "\t", w + "br": "\n", w + "cr": "\n", w + "noBreakHyphen": "-"}
+
+
+def _paragraph_text(paragraph, text_tags):
+    parts = []
+    for element in paragraph.iter():
+        if element.tag in text_tags:
+            text = text_tags[element.tag]
+            parts.append(element.text or "" if text is None else text)
+    return "".join(parts)
+
+
+# Function to stream the text of a DOCX file as it is laid out in the file: the paragraphs
+# and table cells of the body, footnotes, endnotes, headers and footers, in that order. Reads
+# the XML straight from the zip instead of building python-docx's object model of the document.
+def iter_docx_blocks(docx_file):
+    with zipfile.ZipFile(docx_file) as archive:
+        for kind, part in docx_parts(archive):
+            with archive.open(part) as file:
+                for block in _iter_docx_part(file, kind):
+                    # Separators, empty cells and the blank paragraphs of notes carry no text
+                    if block["text"] or (kind == "document" and block["kind"] == "paragraph"):
+                        yield block
+
+
+# Function to stream the text of a DOCX file block by block; headers and footers repeated
+# across sections are kept once
+def iter_docx_paragraphs(docx_file):
+    seen = set()
+    for block in iter_docx_blocks(docx_file):
+        if block["part"] in ("header", "footer"):
+            if block["text"] in seen:
+                continue
+            seen.add(block["text"])
+        yield None, block["text"] + '\n'
+
+
+# Function to stream the text of a TXT file block by block
+def iter_txt_blocks(txt_file):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        block = txt_file.read(TXT_BLOCK_SIZE)
+        if not block:
+            break
+        yield None, decoder.decode(block)
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield None, tail
+
+
+# Function to stream the text of a document as (page number or None, text) segments
+def iter_document(file, file_name):
+    extension = file_extension(file_name)
+    # Streamlit hands back the same upload object on every rerun
+    if hasattr(file, "seek"):
+        file.seek(0)
+    if extension == "pdf":
+        return iter_pdf_pages_parallel(file)
+    elif extension == "docx":
+        return iter_docx_paragraphs(file)
+    elif extension == "txt":
+        return iter_txt_blocks(file)
+    raise UnsupportedFileType(f"Unsupported file type: {extension}")
+
+
+# Function to extract the whole text of a document at once
+def extract_text(file, file_name):
+    return "".join(text for _, text in iter_document(file, file_name))
+
+
+# Function to write a synthetic table-heavy DOCX file, for benchmarks
+def write_sample_docx(path, paragraphs=20000, tables=2000, rows=10, columns=5):
+    w = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    relationship = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    sentence = "The quarterly report covers revenue, costs and the outlook for the next year. "
+
+    def paragraph(text):
+        return f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '<Override PartName="/word/header1.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml"/>'
+            '<Override PartName="/word/footnotes.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"/>'
+            '</Types>'))
+        archive.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{relationship}/officeDocument" Target="word/document.xml"/></Relationships>'))
+        archive.writestr("word/_rels/document.xml.rels", (
+            '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{relationship}/header" Target="header1.xml"/>'
+            f'<Relationship Id="rId2" Type="{relationship}/footnotes" Target="footnotes.xml"/></Relationships>'))
+        archive.writestr("word/header1.xml", f'<w:hdr {w}>{paragraph("Sample report")}</w:hdr>')
+        archive.writestr("word/footnotes.xml", f'<w:footnotes {w}><w:footnote w:id="1">{paragraph("A footnote.")}</w:footnote></w:footnotes>')
+
+        with archive.open("word/document.xml", "w") as file:
+            file.write(f'<?xml version="1.0" encoding="UTF-8"?><w:document {w}><w:body>'.encode())
+            every = max(1, paragraphs // max(1, tables))
+            for number in range(paragraphs):
+                file.write(paragraph(f"{number}. {sentence * 3}").encode())
+                if tables and number % every == 0 and number // every < tables:
+                    cells = "".join(
+                        "<w:tr>" + "".join(f"<w:tc>{paragraph(f'Row {row} column {column}: {sentence}')}</w:tc>"
+                                           for column in range(columns)) + "</w:tr>"
+                        for row in range(rows))
+                    file.write(f"<w:tbl>{cells}</w:tbl>".encode())
+            file.write(b"</w:body></w:document>")
+
+
+def _python_docx_characters(path):
+    from docx import Document
+    doc = Document(path)
+    text = ""
+    for paragraph in doc.paragraphs:
+        text += paragraph.text + "\n"
+    return len(text)
+
+
+# The text is consumed as it streams, as the knowledge base ingests it
+def _streaming_docx_characters(path):
+    with open(path, "rb") as file:
+        return sum(len(text) for _, text in iter_docx_paragraphs(file))
+
+
+# Function to time one extractor in a fresh process, with the growth of its peak memory
+def _benchmark_extractor(name, path):
+    import resource
+    extractors = {"python-docx": _python_docx_characters, "streaming": _streaming_docx_characters}
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    characters = extractors[name](path)
+    seconds = time.perf_counter() - start
+    return {"extractor": name, "seconds": seconds, "characters": characters,
+            "peak_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024}
+
+
+# Compare the streaming DOCX extractor with python-docx on a DOCX file or a synthetic
+# table-heavy one: time, extracted characters (python-docx skips tables, headers and
+# footnotes) and the peak memory each adds to a fresh process
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark DOCX text extraction.")
+    parser.add_argument("docx", nargs="?", help="DOCX file to extract (default: a synthetic one)")
+    parser.add_argument("--paragraphs", type=int, default=20000, help="paragraphs of the synthetic file")
+    parser.add_argument("--tables", type=int, default=2000, help="tables of the synthetic file")
+    args = parser.parse_args()
+
+    path = args.docx
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "sample.docx")
+        write_sample_docx(path, args.paragraphs, args.tables)
+    print(f"{path}: {os.path.getsize(path) / 2 ** 20:.1f} MB")
+    print(f"{'extractor':<14}{'seconds':>9}{'chars':>12}{'chars/s':>12}{'peak MB':>9}")
+    context = multiprocessing.get_context("spawn")
+    for name in ("python-docx", "streaming"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            row = pool.submit(_benchmark_extractor, name, path).result()
+        print(f"{row['extractor']:<14}{row['seconds']:>9.2f}{row['characters']:>12}"
+              f"{row['characters'] / row['seconds']:>12.0f}{row['peak_mb']:>9.0f}")
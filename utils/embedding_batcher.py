@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+# Largest number of texts embedded in one model call
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64"))
+
+# Milliseconds a partial batch waits for more requests before it is embedded
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "10"))
+
+# Threads running model calls; the model already uses every core for one batch
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+
+
+# Function to combine the futures of several parts into one future of the concatenated results
+def _gather(parts, future):
+    results = [None] * len(parts)
+    remaining = [len(parts)]
+    lock = threading.Lock()
+
+    def on_done(index, part):
+        with lock:
+            if future.done():
+                return
+            if part.exception() is not None:
+                future.set_exception(part.exception())
+                return
+            results[index] = part.result()
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                future.set_result([vector for result in results for vector in result])
+
+    for index, part in enumerate(parts):
+        part.add_done_callback(lambda part, index=index: on_done(index, part))
+
+
+# Collects embedding requests from every session into micro-batches.
+# Large requests are cut into batch-sized parts, so a big upload does not hold up
+# other sessions, and query embeddings are always batched before document chunks.
+class EmbeddingBatcher:
+    KINDS = ("query", "documents")
+
+    def __init__(self, embed_documents, embed_queries, max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+                 max_wait_ms=EMBEDDING_MAX_WAIT_MS, workers=EMBEDDING_WORKERS):
+        self._embed = {"documents": embed_documents, "query": embed_queries}
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self._pending = {kind: deque() for kind in self.KINDS}
+        self._pending_texts = {kind: 0 for kind in self.KINDS}
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stats = {"batches": 0, "texts": 0, "requests": 0}
+
+    # Function to queue texts for embedding; returns a future of their vectors in order
+    def submit(self, texts, kind="documents"):
+        texts = list(texts)
+        future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+
+        parts = []
+        with self._condition:
+            self._start_workers()
+            for start in range(0, len(texts), self.max_batch_size):
+                part = Future()
+                piece = texts[start:start + self.max_batch_size]
+                self._pending[kind].append((piece, part))
+                self._pending_texts[kind] += len(piece)
+                parts.append(part)
+            self._stats["requests"] += 1
+            self._condition.notify_all()
+
+        _gather(parts, future)
+        return future
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats, queued_texts=sum(self._pending_texts.values()))
+        stats["average_batch_size"] = stats["texts"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"embedding-batcher-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_kind(self):
+        for kind in self.KINDS:
+            if self._pending[kind]:
+                return kind
+        return None
+
+    # Function to take queued parts of one kind, up to the batch size
+    def _take(self, kind):
+        batch = []
+        size = 0
+        pending = self._pending[kind]
+        while pending and (not batch or size + len(pending[0][0]) <= self.max_batch_size):
+            texts, part = pending.popleft()
+            batch.append((texts, part))
+            size += len(texts)
+        self._pending_texts[kind] -= size
+        return batch
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while self._next_kind() is None:
+                    self._condition.wait()
+                kind = self._next_kind()
+
+                # Give other sessions a moment to add to a batch that is not full yet
+                deadline = time.monotonic() + self.max_wait
+                while self._pending_texts[kind] < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._take(kind)
+                if not batch:
+                    continue
+            self._run(kind, batch)
+
+    def _run(self, kind, batch):
+        texts = [text for piece, _ in batch for text in piece]
+        try:
+            vectors = self._embed[kind](texts)
+        except Exception as error:
+            for _, part in batch:
+                part.set_exception(error)
+            return
+
+        with self._condition:
+            self._stats["batches"] += 1
+            self._stats["texts"] += len(texts)
+        offset = 0
+        for piece, part in batch:
+            part.set_result(vectors[offset:offset + len(piece)])
+            offset += len(piece)
+
+
+# LangChain embeddings that send every call through an EmbeddingBatcher,
+# so FAISS.from_texts and similarity_search share batches across sessions
+class BatchedEmbeddings(Embeddings):
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    def embed_documents(self, texts):
+        return self.batcher.submit(texts, "documents").result()
+
+    def embed_query(self, text):
+        return self.batcher.submit([text], "query").result()[0]
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+# SQLite file holding the cached vectors
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+
+# Number of vectors kept before the least recently used ones are evicted
+# (a MiniLM vector takes 1.5 KB, so the default is about 750 MB)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+
+# SQLite limits the number of parameters of one statement
+_SQL_BATCH = 500
+
+
+# Disk-backed map from hash(model, kind, text) to a float32 vector, with LRU eviction
+class EmbeddingCache:
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model, kind, text):
+        return hashlib.sha256(f"{model}\0{kind}\0{text}".encode('utf-8')).digest()
+
+    # Function to look up vectors; returns {position in texts: vector} for the hits
+    def get_many(self, model, kind, texts):
+        keys = [self.key(model, kind, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = list(set(keys[start:start + _SQL_BATCH]))
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+            hit_count = sum(1 for key in keys if key in found)
+            self.hits += hit_count
+            self.misses += len(keys) - hit_count
+
+        hits = {}
+        for position, key in enumerate(keys):
+            if key in found:
+                vector = array('f')
+                vector.frombytes(found[key])
+                hits[position] = vector.tolist()
+        return hits
+
+    def put_many(self, model, kind, texts, vectors):
+        now = time.time()
+        rows = [(self.key(model, kind, text), array('f', vector).tobytes(), now) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            cursor = self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._entries += max(cursor.rowcount, 0)
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        # Drop an extra 10% so eviction does not run on every insert
+        excess = self._entries - int(self.max_entries * 0.9)
+        self._connection.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        return {"entries": self._entries, "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+# LangChain embeddings that answer from an EmbeddingCache and only embed the misses
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, cache, model):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts):
+        vectors = self.cache.get_many(self.model, "documents", texts)
+        misses = [position for position in range(len(texts)) if position not in vectors]
+        if misses:
+            miss_texts = [texts[position] for position in misses]
+            miss_vectors = self.embeddings.embed_documents(miss_texts)
+            self.cache.put_many(self.model, "documents", miss_texts, miss_vectors)
+            vectors.update(zip(misses, miss_vectors))
+        return [vectors[position] for position in range(len(texts))]
+
+    def embed_query(self, text):
+        vectors = self.cache.get_many(self.model, "query", [text])
+        if vectors:
+            return vectors[0]
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model, "query", [text], [vector])
+        return vector
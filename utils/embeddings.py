@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# Load the embedding model in the background when Home.py starts
+WARM_UP_EMBEDDINGS = os.getenv("WARM_UP_EMBEDDINGS", "1") == "1"
+
+_embeddings = None
+_batched_embeddings = None
+_shared_embeddings = None
+_lock = threading.Lock()
+_warm_up_thread = None
+_stats = {"model": EMBEDDING_MODEL, "loaded": False, "load_seconds": None, "load_memory_bytes": None}
+
+
+# Function to read the resident memory of the current process in bytes
+def resident_memory():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current memory, but available on every Unix
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Function to get the embedding model shared by every session of the process.
+# The weights are loaded once, on first use.
+def get_embedding_model():
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                memory_before = resident_memory()
+                start = time.perf_counter()
+                from langchain_community.embeddings import HuggingFaceBgeEmbeddings
+                _embeddings = HuggingFaceBgeEmbeddings(model_name=EMBEDDING_MODEL)
+                _stats.update(
+                    loaded=True,
+                    load_seconds=time.perf_counter() - start,
+                    load_memory_bytes=resident_memory() - memory_before,
+                )
+                logger.info("Loaded embedding model %s in %.2fs (+%.1f MB resident)", EMBEDDING_MODEL,
+                            _stats["load_seconds"], _stats["load_memory_bytes"] / 2 ** 20)
+    return _embeddings
+
+
+def _embed_documents(texts):
+    return get_embedding_model().embed_documents(texts)
+
+
+# Queries are embedded in batches too, with the instruction embed_query would add
+def _embed_queries(texts):
+    model = get_embedding_model()
+    return model.embed_documents([model.query_instruction + text for text in texts])
+
+
+# Function to get embeddings that go through one batcher shared by every session, which
+# runs the shared model on micro-batches, without the disk cache. For one-off texts such
+# as sentiment inputs, which would push document chunks out of the cache.
+def get_batched_embeddings():
+    global _batched_embeddings
+    if _batched_embeddings is None:
+        with _lock:
+            if _batched_embeddings is None:
+                # Imported here so pages that never embed do not import langchain
+                from utils.embedding_batcher import BatchedEmbeddings, EmbeddingBatcher
+                _batched_embeddings = BatchedEmbeddings(EmbeddingBatcher(_embed_documents, _embed_queries))
+    return _batched_embeddings
+
+
+# Function to get the embeddings used by knowledge bases: texts embedded before are
+# read from the disk cache, and the rest go through the shared batcher
+def get_embeddings():
+    global _shared_embeddings
+    if _shared_embeddings is None:
+        batched = get_batched_embeddings()
+        with _lock:
+            if _shared_embeddings is None:
+                from utils.embedding_cache import CachedEmbeddings, EmbeddingCache
+                _shared_embeddings = CachedEmbeddings(batched, EmbeddingCache(), EMBEDDING_MODEL)
+    return _shared_embeddings
+
+
+# Function to load the model and run one embedding so the first question does not pay for it
+def warm_up():
+    get_embedding_model().embed_query("warm up")
+
+
+# Function to start the warm-up in a background thread, at most once per process
+def start_warm_up():
+    global _warm_up_thread
+    with _lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name="embedding-warm-up", daemon=True)
+            _warm_up_thread.start()
+
+
+# Function to report the model's load time and memory, the current resident memory
+# and the batching and cache counters
+def embedding_stats():
+    stats = dict(_stats, resident_memory_bytes=resident_memory())
+    if _batched_embeddings is not None:
+        stats["batching"] = _batched_embeddings.batcher.stats()
+    if _shared_embeddings is not None:
+        stats["cache"] = _shared_embeddings.cache.stats()
+    return stats
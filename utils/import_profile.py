@@ -0,0 +1,82 @@
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs a page's top-level code (its imports; main() only runs under Streamlit) twice in
+# the same process: the first run is a cold start, the second a Streamlit rerun
+_PROBE = '''
+import json, resource, runpy, sys, time
+sys.path.insert(0, {root!r})
+timings = []
+for _ in range(2):
+    start = time.perf_counter()
+    runpy.run_path({script!r}, run_name="__import_profile__")
+    timings.append(time.perf_counter() - start)
+print(json.dumps({{"cold_seconds": timings[0], "warm_seconds": timings[1],
+                  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+'''
+
+
+def app_scripts():
+    return ["Home.py"] + sorted(os.path.relpath(path, ROOT) for path in glob.glob(os.path.join(ROOT, "pages", "*.py")))
+
+
+# Function to add up the import time of every module by top-level package, from the
+# output of `python -X importtime`
+def import_time_by_package(importtime_output):
+    totals = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, module = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        package = module.strip().split(".")[0]
+        totals[package] = totals.get(package, 0.0) + int(self_us) / 1e6
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+# Function to profile one script in a fresh interpreter
+def profile_script(script):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(root=ROOT, script=os.path.join(ROOT, script))],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {script} failed:\n{result.stderr[-2000:]}")
+    profile = json.loads(result.stdout.strip().splitlines()[-1])
+    profile["script"] = script
+    profile["packages"] = import_time_by_package(result.stderr)
+    return profile
+
+
+# Profile the startup of Home.py and every page: cold and warm (rerun) time, peak memory and
+# the import time of the heaviest packages. Exits with 1 when a page is over --max-cold-seconds.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the import time of the app's pages.")
+    parser.add_argument("scripts", nargs="*", help="scripts to profile, relative to the repository (default: all pages)")
+    parser.add_argument("--top", type=int, default=5, help="packages listed per page")
+    parser.add_argument("--json", action="store_true", help="print the profiles as JSON")
+    parser.add_argument("--max-cold-seconds", type=float, help="fail when a page takes longer than this to import")
+    args = parser.parse_args()
+
+    profiles = [profile_script(script) for script in args.scripts or app_scripts()]
+    if args.json:
+        print(json.dumps(profiles, indent=2))
+    else:
+        for profile in profiles:
+            print(f"{profile['script']}: cold {profile['cold_seconds']:.2f}s, warm {1000 * profile['warm_seconds']:.1f}ms, "
+                  f"peak {profile['max_rss_mb']:.0f} MB")
+            for package, seconds in list(profile["packages"].items())[:args.top]:
+                print(f"    {package:<28}{seconds:>7.3f}s")
+
+    if args.max_cold_seconds is not None:
+        slow = [profile["script"] for profile in profiles if profile["cold_seconds"] > args.max_cold_seconds]
+        if slow:
+            print(f"Over {args.max_cold_seconds}s: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
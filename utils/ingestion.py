@@ -0,0 +1,82 @@
+import os
+import queue
+import threading
+
+from utils import text_splitter
+
+# Chunks embedded and added to the index at a time
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+
+# Batches of chunks waiting for embedding; bounds the memory used ahead of the embedder
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+
+_DONE = object()
+
+
+# Function to cut a stream of (page, text) segments into overlapping chunks, without
+# ever holding more than a few chunks of text (see utils.text_splitter). Yields
+# (text, metadata) with the chunk's character offsets in the whole document and the
+# page it starts on.
+def iter_chunks(segments, chunk_size=1000, chunk_overlap=200, unit=text_splitter.CHARS):
+    chunks = text_splitter.iter_chunks(segments, chunk_size, chunk_overlap, unit)
+    for chunk_id, (text, (start, end, page)) in enumerate(chunks):
+        yield text, {"chunk_id": chunk_id, "start": start, "end": end, "page": page}
+
+
+# Function to group a stream of chunks into lists of `size` items
+def iter_batches(chunks, size=INGEST_BATCH_SIZE):
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Function to run extraction/chunking and embedding/indexing as two overlapping stages.
+# A producer thread fills a bounded queue with chunk batches while the calling thread
+# embeds each batch and hands it to `add_batch(texts, vectors, metadatas)` as soon as it
+# is ready, so the index can be searched before the document is fully ingested.
+def run_pipeline(segments, embeddings, add_batch, chunk_size=1000, chunk_overlap=200, unit=text_splitter.CHARS):
+    batches = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for batch in iter_batches(iter_chunks(segments, chunk_size, chunk_overlap, unit)):
+                while not stop.is_set():
+                    try:
+                        batches.put(batch, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as error:
+            errors.append(error)
+        finally:
+            batches.put(_DONE)
+
+    producer = threading.Thread(target=produce, name="ingestion-producer", daemon=True)
+    producer.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                break
+            texts = [text for text, _ in batch]
+            metadatas = [metadata for _, metadata in batch]
+            add_batch(texts, embeddings.embed_documents(texts), metadatas)
+    finally:
+        stop.set()
+        # Unblock the producer if it is waiting on a full queue
+        while producer.is_alive():
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    if errors:
+        raise errors[0]
@@ -0,0 +1,430 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import faiss
+
+from utils import ann_index
+from utils.answer_cache import SemanticAnswerCache
+from utils.documents import iter_document
+from utils.embeddings import EMBEDDING_MODEL, get_embeddings
+from utils.ingestion import run_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Settings that define a knowledge base. They are part of the cache key, so
+# changing any of them makes previously cached indexes unreachable.
+SPLITTER_CONFIG = {"chunk_size": 1000, "chunk_overlap": 200, "unit": "chars"}
+CHUNKER_VERSION = 3
+
+# Where FAISS indexes (index.faiss) and their chunk stores (index.pkl) are kept
+KB_CACHE_DIR = os.getenv("KB_CACHE_DIR", os.path.join(".cache", "knowledge_bases"))
+
+# Memory the knowledge bases of the process may use, shared by every session. Beyond it the
+# least recently used ones are released; they are on disk and reopen memory-mapped on next use.
+KB_MEMORY_BUDGET_MB = int(os.getenv("KB_MEMORY_BUDGET_MB", "1024"))
+
+# Rough memory of one chunk in the chunk store besides its text (Document, metadata, ids)
+_CHUNK_OVERHEAD_BYTES = 600
+
+_knowledge_bases = OrderedDict()
+_cache_lock = threading.Lock()
+_build_locks = {}
+
+
+# A FAISS index that can be searched while chunks are still being added to it
+class KnowledgeBase:
+    def __init__(self, store=None, path=None):
+        self.store = store
+        # Directory the knowledge base is saved in, once it is
+        self.path = path
+        self.chunk_count = store.index.ntotal if store is not None else 0
+        self.text_bytes = _text_bytes(store) if store is not None else 0
+        self.error = None
+        # Sessions that opened this knowledge base
+        self.sessions = set()
+        # Answers to earlier questions about this document, reused for paraphrases
+        self.answer_cache = SemanticAnswerCache()
+        # Whether the saved index is memory-mapped rather than read into private memory
+        self.index_mapped = False
+        self._spilled = False
+        self._lock = threading.RLock()
+        self._searchable = threading.Event()
+        self._complete = threading.Event()
+        if store is not None:
+            self._searchable.set()
+            self._complete.set()
+
+    @property
+    def complete(self):
+        return self._complete.is_set()
+
+    def add(self, texts, vectors, metadatas):
+        with self._lock:
+            if self.store is None:
+                from langchain_community.vectorstores import FAISS
+                self.store = FAISS.from_embeddings(list(zip(texts, vectors)), get_embeddings(), metadatas=metadatas)
+            else:
+                self.store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+            self.chunk_count += len(texts)
+            self.text_bytes += sum(len(text) for text in texts)
+        self._searchable.set()
+
+    # Function to replace the flat index built during ingestion with the index type suited
+    # to the corpus size. The new index is built while searches still use the flat one.
+    def optimize_index(self):
+        with self._lock:
+            index = self.store.index if self.store is not None else None
+        optimized = ann_index.optimize_index(index) if index is not None else None
+        if optimized is not None:
+            with self._lock:
+                self.store.index = optimized
+
+    # Function to switch to the saved copy of the index, memory-mapped where faiss can, so
+    # its pages are shared with the other processes that open the same document
+    def use_saved(self, path):
+        index, mapped = _read_index(path)
+        with self._lock:
+            self.path = path
+            self.store.index = index
+            self.index_mapped = mapped
+
+    # Function to release the index and chunk store of a saved knowledge base. They are
+    # reopened from disk when the knowledge base is looked up or searched again.
+    def spill(self):
+        with self._lock:
+            if self.path is None or not self.complete or self.store is None:
+                return False
+            self.store = None
+            self._spilled = True
+            return True
+
+    @property
+    def spilled(self):
+        return self._spilled
+
+    def _open(self):
+        with self._lock:
+            if self._spilled:
+                self.store, self.index_mapped = _open_store(self.path)
+                self._spilled = False
+            return self.store
+
+    # Function to estimate the memory used, as (private bytes, memory-mapped bytes). A saved
+    # index that could not be mapped is counted as private, like one still being built.
+    def memory_usage(self):
+        with self._lock:
+            if self.store is None:
+                return 0, 0
+            private = self.text_bytes + self.chunk_count * _CHUNK_OVERHEAD_BYTES
+            index = self.store.index
+            if self.path is not None:
+                index_bytes = os.path.getsize(os.path.join(self.path, "index.faiss"))
+            elif isinstance(index, faiss.IndexFlat):
+                index_bytes = index.ntotal * index.code_size
+            else:
+                index_bytes = ann_index.index_memory_bytes(index)
+            if self.index_mapped:
+                return private, index_bytes
+            return private + index_bytes, 0
+
+    def finish(self, error=None):
+        self.error = error
+        self._searchable.set()
+        self._complete.set()
+
+    # Function to wait until the first chunks are indexed (or ingestion ends)
+    def wait_until_searchable(self, timeout=None):
+        return self._searchable.wait(timeout)
+
+    def wait_until_complete(self, timeout=None):
+        return self._complete.wait(timeout)
+
+    def similarity_search(self, query, k=4):
+        # Embed outside the lock so searches do not hold up ingestion
+        return self.similarity_search_by_vector(get_embeddings().embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, vector, k=4):
+        with self._lock:
+            if self._open() is None:
+                return []
+            return self.store.similarity_search_by_vector(vector, k=k)
+
+    # Function to search with the distance of each chunk to the query, closest first
+    def similarity_search_with_score_by_vector(self, vector, k=4):
+        with self._lock:
+            if self._open() is None:
+                return []
+            return self.store.similarity_search_with_score_by_vector(vector, k=k)
+
+    def save_local(self, path):
+        with self._lock:
+            self.store.save_local(path)
+
+
+def _text_bytes(store):
+    return sum(len(document.page_content) for document in store.docstore._dict.values())
+
+
+# Function to get the anonymous (private) resident memory of the process in bytes, or None
+# where /proc is not available
+def _anonymous_rss():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+# Function to read a saved index in place (IO_FLAG_MMAP_IFC): its vectors and graph stay in
+# the page cache, are shared by every worker process and are never copied into private
+# memory. Older faiss releases without that flag get IO_FLAG_MMAP, which maps only
+# the lists of IVF indexes and copies flat and HNSW ones. Returns (index, mapped); an index
+# whose reading grew private memory by half its size or more is reported as not mapped.
+def _read_index(path):
+    file_name = os.path.join(path, "index.faiss")
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    rss_before = _anonymous_rss()
+    try:
+        index = faiss.read_index(file_name, flag)
+    except RuntimeError as error:
+        logger.warning("Could not memory-map %s, reading it into memory: %s", file_name, error)
+        return ann_index.configure_index(faiss.read_index(file_name)), False
+    rss_after = _anonymous_rss()
+    mapped = rss_before is None or rss_after - rss_before < os.path.getsize(file_name) / 2
+    if not mapped:
+        logger.info("faiss %s copied %s into private memory instead of mapping it", faiss.__version__, file_name)
+    return ann_index.configure_index(index), mapped
+
+
+# Function to open a saved chunk store and index; returns (store, whether the index is mapped)
+def _open_store(path):
+    from langchain_community.vectorstores import FAISS
+    # The chunk store is a pickle we wrote ourselves into KB_CACHE_DIR
+    with open(os.path.join(path, "index.pkl"), "rb") as chunk_store:
+        docstore, index_to_docstore_id = pickle.load(chunk_store)
+    index, mapped = _read_index(path)
+    return FAISS(get_embeddings(), index, docstore, index_to_docstore_id), mapped
+
+
+# Function to compute the cache key of a document: its bytes plus the ingestion config
+def knowledge_base_key(data):
+    config = json.dumps({"splitter": SPLITTER_CONFIG, "chunker": CHUNKER_VERSION, "embedding_model": EMBEDDING_MODEL},
+                        sort_keys=True)
+    digest = hashlib.sha256(config.encode('utf-8'))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+# Function to stream (page, text) segments into a knowledge base
+def ingest(segments, knowledgebase):
+    run_pipeline(segments, get_embeddings(), knowledgebase.add, **SPLITTER_CONFIG)
+
+
+def process_text(text):
+    # Split the text into chunks, embed them and store them in a FAISS index
+    knowledgebase = KnowledgeBase()
+    ingest([(None, text)], knowledgebase)
+    knowledgebase.optimize_index()
+    knowledgebase.finish()
+    return knowledgebase
+
+
+def _remember(key, knowledgebase):
+    with _cache_lock:
+        _knowledge_bases[key] = knowledgebase
+        _knowledge_bases.move_to_end(key)
+    _enforce_memory_budget()
+
+
+# Function to release the least recently used knowledge bases while the memory budget is
+# exceeded. Only saved ones can go; documents still being ingested stay in memory. Released
+# knowledge bases stay registered, with their answer cache and sessions, and reopen on lookup.
+def _enforce_memory_budget():
+    budget = KB_MEMORY_BUDGET_MB * 2 ** 20
+    with _cache_lock:
+        entries = list(_knowledge_bases.items())
+    usage = {key: knowledgebase.memory_usage()[0] for key, knowledgebase in entries}
+    total = sum(usage.values())
+    # The most recently used knowledge base is kept even when it alone is over budget
+    for key, knowledgebase in entries[:-1]:
+        if total <= budget:
+            break
+        if usage[key] and knowledgebase.spill():
+            total -= usage[key]
+            logger.info("Released knowledge base %s (%.1f MB) to stay within the memory budget",
+                        key[:12], usage[key] / 2 ** 20)
+
+
+def _forget(key, knowledgebase):
+    with _cache_lock:
+        if _knowledge_bases.get(key) is knowledgebase:
+            del _knowledge_bases[key]
+
+
+def _lookup(key):
+    with _cache_lock:
+        knowledgebase = _knowledge_bases.get(key)
+        if knowledgebase is not None:
+            _knowledge_bases.move_to_end(key)
+        return knowledgebase
+
+
+def _load_from_disk(key):
+    path = os.path.join(KB_CACHE_DIR, key)
+    if not os.path.exists(os.path.join(path, "index.faiss")):
+        return None
+    store, mapped = _open_store(path)
+    knowledgebase = KnowledgeBase(store, path)
+    knowledgebase.index_mapped = mapped
+    return knowledgebase
+
+
+def _save_to_disk(key, knowledgebase):
+    os.makedirs(KB_CACHE_DIR, exist_ok=True)
+    # Write into a scratch directory first so readers never see a half-written index
+    tmp_path = tempfile.mkdtemp(dir=KB_CACHE_DIR, prefix=f".{key}-")
+    try:
+        knowledgebase.save_local(tmp_path)
+        os.replace(tmp_path, os.path.join(KB_CACHE_DIR, key))
+    except OSError:
+        # Another process stored the same document first; its copy is identical
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    path = os.path.join(KB_CACHE_DIR, key)
+    return path if os.path.exists(os.path.join(path, "index.faiss")) else None
+
+
+# Function to ingest a document in the background and persist it once complete
+def _ingest_in_background(key, data, file_name, knowledgebase):
+    def run():
+        try:
+            ingest(iter_document(io.BytesIO(data), file_name), knowledgebase)
+        except Exception as error:
+            logger.exception("Ingestion of %s failed", file_name)
+            # Drop the broken knowledge base so the next upload retries
+            _forget(key, knowledgebase)
+            knowledgebase.finish(error)
+            return
+        # The chunks are all indexed, so the knowledge base completes even if these steps fail
+        try:
+            if knowledgebase.store is not None:
+                try:
+                    knowledgebase.optimize_index()
+                except Exception:
+                    logger.exception("Could not build the approximate index of %s, keeping exact search", file_name)
+                path = _save_to_disk(key, knowledgebase)
+                if path is not None:
+                    knowledgebase.use_saved(path)
+        except Exception:
+            logger.exception("Could not save the knowledge base of %s, keeping it in memory", file_name)
+        finally:
+            knowledgebase.finish()
+        _enforce_memory_budget()
+
+    threading.Thread(target=run, name=f"ingest-{key[:12]}", daemon=True).start()
+
+
+# Function to get the knowledge base of a document. Known documents are served from
+# memory or disk; new ones are ingested in the background and can be searched as soon
+# as their first chunks are indexed (see KnowledgeBase.complete).
+def get_knowledge_base(data, file_name, session_id=None):
+    key = knowledge_base_key(data)
+
+    knowledgebase = _lookup(key)
+    if knowledgebase is not None:
+        knowledgebase.sessions.add(session_id)
+        if knowledgebase.spilled:
+            knowledgebase._open()
+            _enforce_memory_budget()
+        return knowledgebase
+
+    with _cache_lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+
+    # Only one session ingests a given document; the others reuse its knowledge base
+    with build_lock:
+        knowledgebase = _lookup(key)
+        if knowledgebase is None:
+            knowledgebase = _load_from_disk(key)
+            if knowledgebase is None:
+                knowledgebase = KnowledgeBase()
+                _ingest_in_background(key, data, file_name, knowledgebase)
+            _remember(key, knowledgebase)
+
+    with _cache_lock:
+        _build_locks.pop(key, None)
+    knowledgebase.sessions.add(session_id)
+    return knowledgebase
+
+
+# Function to report the memory used by the registered knowledge bases: private memory
+# (chunk stores, and indexes not saved yet) counts against KB_MEMORY_BUDGET_MB, while
+# memory-mapped indexes live in the page cache shared by every process. Released ones use
+# no memory until they are reopened. A session's usage is that of the knowledge bases it
+# opened, including ones shared with other sessions.
+def memory_report():
+    with _cache_lock:
+        entries = list(_knowledge_bases.items())
+    report = {"budget_bytes": KB_MEMORY_BUDGET_MB * 2 ** 20, "private_bytes": 0, "mapped_bytes": 0,
+              "knowledge_bases": len(entries), "released": 0, "sessions": {}}
+    for key, knowledgebase in entries:
+        report["released"] += knowledgebase.spilled
+        private, mapped = knowledgebase.memory_usage()
+        report["private_bytes"] += private
+        report["mapped_bytes"] += mapped
+        for session_id in list(knowledgebase.sessions):
+            report["sessions"][session_id] = report["sessions"].get(session_id, 0) + private + mapped
+    return report
+
+
+# Function to check that reopening a saved knowledge base does not grow private memory. Its
+# index is read `reopens` times, as when it is spilled and searched again, each copy is
+# searched and kept open, and the growth of anonymous memory is compared with the index size.
+def check_reopen_memory(path, reopens=3):
+    import numpy as np
+    rss_before = _anonymous_rss()
+    if rss_before is None:
+        raise RuntimeError("Anonymous memory can only be measured where /proc is available")
+    indexes = []
+    for _ in range(reopens):
+        index, mapped = _read_index(path)
+        index.search(np.zeros((1, index.d), dtype=np.float32), 4)
+        indexes.append(index)
+    return {"path": path, "index_type": type(indexes[0]).__name__, "mapped": mapped,
+            "index_bytes": os.path.getsize(os.path.join(path, "index.faiss")),
+            "growth_bytes": _anonymous_rss() - rss_before, "reopens": reopens}
+
+
+# Check that saved knowledge bases reopen without copying their indexes into private memory
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the private memory used by reopening saved knowledge bases.")
+    parser.add_argument("paths", nargs="*", help="knowledge base directories (default: every one in KB_CACHE_DIR)")
+    parser.add_argument("--reopens", type=int, default=3, help="times each index is reopened")
+    parser.add_argument("--max-growth", type=float, default=0.1,
+                        help="largest private memory growth allowed, as a fraction of one index (exits with 1 above it)")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(os.path.join(KB_CACHE_DIR, name) for name in os.listdir(KB_CACHE_DIR)
+                                 if os.path.exists(os.path.join(KB_CACHE_DIR, name, "index.faiss")))
+    failed = False
+    print(f"{'knowledge base':<16}{'index':<26}{'mapped':>8}{'index MB':>10}{'growth MB':>11}")
+    for path in paths:
+        row = check_reopen_memory(path, args.reopens)
+        failed |= row["growth_bytes"] > args.max_growth * row["index_bytes"]
+        print(f"{os.path.basename(path)[:12]:<16}{row['index_type']:<26}{str(row['mapped']):>8}"
+              f"{row['index_bytes'] / 2 ** 20:>10.1f}{row['growth_bytes'] / 2 ** 20:>11.1f}")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,19 @@
+from utils.llm.clients import get_client
+from utils.llm.gateway import (
+    CONTEXT_WINDOWS,
+    DEFAULT_MODEL,
+    MODELS,
+    PERSONA_PREFIXES,
+    RESPONSE_TOKEN_RESERVE,
+    build_prompt,
+    call_model,
+    complete,
+    fits_context,
+    gateway_stats,
+    stream_complete,
+    stream_model,
+)
+from utils.llm.scheduler import BULK, INTERACTIVE, get_scheduler
+from utils.llm.hedging import COMPLETE, STREAM, hedge_stats, hedged_call, latency_tracker
+from utils.llm.response_cache import get_response_cache
+from utils.llm.single_flight import single_flight
@@ -0,0 +1,48 @@
+import os
+import threading
+
+TOGETHER_AI_API = os.getenv("TOGETHER_AI_API_KEY")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Seconds to wait for a provider before giving up on a request
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+
+# The provider SDKs take about a second to import, so each is imported when its client is first needed.
+# Their own retries are turned off: the request scheduler retries instead, within the provider's limits.
+def _create_together_client():
+    from together import Together
+    return Together(api_key=TOGETHER_AI_API, timeout=LLM_TIMEOUT, max_retries=0)
+
+
+def _create_gemini_client():
+    from google import genai
+    from google.genai import types
+    return genai.Client(
+        api_key=GEMINI_API_KEY,
+        http_options=types.HttpOptions(timeout=int(LLM_TIMEOUT * 1000),
+                                       retry_options=types.HttpRetryOptions(attempts=1)),
+    )
+
+
+_CLIENT_FACTORIES = {
+    "together": _create_together_client,
+    "gemini": _create_gemini_client,
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+# Function to get the process-wide client of a provider.
+# Clients are created once and reused by every session, so their HTTP
+# connection pools stay warm and requests skip the TLS handshake.
+def get_client(provider):
+    client = _clients.get(provider)
+    if client is None:
+        with _lock:
+            client = _clients.get(provider)
+            if client is None:
+                client = _CLIENT_FACTORIES[provider]()
+                _clients[provider] = client
+    return client
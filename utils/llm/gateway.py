@@ -0,0 +1,209 @@
+import os
+
+from utils.llm.clients import get_client
+from utils.llm.hedging import COMPLETE, LLM_HEDGING, STREAM, hedge_stats, hedged_call, latency_tracker
+from utils.llm.response_cache import ResponseCache, get_response_cache
+from utils.llm.scheduler import INTERACTIVE, get_scheduler
+from utils.llm.single_flight import single_flight
+from utils.tokens import estimate_tokens
+
+# Model names shown in the UI, mapped to (provider, provider model id)
+MODELS = {
+    "LLama 3.3 Meta": ("together", "meta-llama/Llama-3.3-70B-Instruct-Turbo"),
+    "Google Gemini": ("gemini", "gemini-2.0-flash-exp"),
+    "Deepseek": ("together", "deepseek-ai/DeepSeek-R1-Distill-Llama-70B-free"),
+}
+
+DEFAULT_MODEL = "LLama 3.3 Meta"
+
+# Context window (in tokens) of each model as served by its provider
+CONTEXT_WINDOWS = {
+    "LLama 3.3 Meta": 131072,
+    "Google Gemini": 1048576,
+    "Deepseek": 8192,
+}
+
+# Tokens kept free in the context window for the model's answer
+RESPONSE_TOKEN_RESERVE = int(os.getenv("RESPONSE_TOKEN_RESERVE", "2048"))
+
+PERSONA_PREFIXES = {
+    "Technical": "Respond in a highly technical manner with detailed explanations.",
+    "Casual": "Respond in a casual, friendly tone.",
+    "Professional": "Respond in a formal, professional tone.",
+}
+
+
+# Function to build the final prompt from the persona, the query and an optional context
+def build_prompt(query, context="", persona="Professional"):
+    prompt = PERSONA_PREFIXES.get(persona, "") + "\n\n" + query
+    if context:
+        prompt += "\n\n" + context
+    return prompt
+
+
+# Function to make the provider call behind `complete`
+def _complete(provider, model_id, prompt):
+    client = get_client(provider)
+
+    if provider == "together":
+        response = client.chat.completions.create(
+            model=model_id,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return response.choices[0].message.content
+
+    elif provider == "gemini":
+        response = client.models.generate_content(
+            model=model_id,
+            contents=prompt
+        )
+        return response.text
+
+
+# Function to schedule a provider call for a model; returns a concurrent Future of its result.
+# The scheduler applies the provider's rate limits and retries, and every call feeds the
+# model's latency statistics of its kind (a full answer, or the first token of a stream).
+def _submit(call, model, prompt, priority, kind=COMPLETE):
+    provider, model_id = MODELS[model]
+    fn = latency_tracker.timed(model, lambda: call(provider, model_id, prompt), kind)
+    return get_scheduler().submit(provider, fn, priority, estimate_tokens(prompt))
+
+
+# Function to decide whether a request is hedged: by default only interactive requests
+# are, when LLM_HEDGING is enabled, since bulk work is not waiting on a user
+def _should_hedge(hedge, priority):
+    return LLM_HEDGING and priority == INTERACTIVE if hedge is None else hedge
+
+
+# Function to list the models a prompt can be sent to as a backup
+def _backup_models(prompt):
+    return [model for model in MODELS if fits_context(model, prompt)]
+
+
+def _cache_key(model, prompt):
+    provider, model_id = MODELS[model]
+    return ResponseCache.key(provider, model_id, prompt)
+
+
+# Function to find the cached response of a prompt; returns (cache key, response or None).
+# With cache=False the lookup is skipped, and the fresh response replaces the cached one.
+def _cached_response(model, prompt, cache):
+    key = _cache_key(model, prompt)
+    return key, get_response_cache().get(key) if cache else None
+
+
+# Function to send a ready-made prompt to one of the supported models
+def complete(prompt, model=DEFAULT_MODEL, priority=INTERACTIVE, hedge=None, cache=True):
+    key, answer = _cached_response(model, prompt, cache)
+    if answer is not None:
+        return answer
+    # Identical requests already in flight share that call instead of making their own
+    return single_flight.do(key, lambda: _complete_uncached(key, prompt, model, priority, hedge))
+
+
+def _complete_uncached(key, prompt, model, priority, hedge):
+    if not _should_hedge(hedge, priority):
+        answer = _submit(_complete, model, prompt, priority).result()
+    else:
+        answered_by, answer = hedged_call(model, lambda candidate: _submit(_complete, candidate, prompt, priority),
+                                          _backup_models(prompt))
+        # A backup's answer is cached as that model's, never as the requested model's
+        key = _cache_key(answered_by, prompt)
+    if answer is not None:
+        get_response_cache().put(key, answer)
+    return answer
+
+
+def call_model(model, query, context="", persona="Professional", cache=True):
+    return complete(build_prompt(query, context, persona), model, cache=cache)
+
+
+# Function to check whether a prompt and the model's answer fit the model's context window
+def fits_context(model, prompt, reserved_tokens=RESPONSE_TOKEN_RESERVE):
+    return estimate_tokens(prompt) + reserved_tokens <= CONTEXT_WINDOWS[model]
+
+
+# Function to make the provider call behind `stream_complete`, yielding text as it arrives
+def _stream_text(provider, model_id, prompt):
+    client = get_client(provider)
+
+    if provider == "together":
+        stream = client.chat.completions.create(
+            model=model_id,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+    elif provider == "gemini":
+        stream = client.models.generate_content_stream(
+            model=model_id,
+            contents=prompt
+        )
+        try:
+            for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            stream.close()
+
+
+# Function to start a stream and wait for its first piece of text.
+# Streams are only sent once they are read, so this is the part to schedule and time.
+def _open_stream(provider, model_id, prompt):
+    stream = _stream_text(provider, model_id, prompt)
+    return next(stream, None), stream
+
+
+# Function to stream a ready-made prompt to one of the supported models, yielding text as it arrives.
+# When hedged, the race is decided by which model starts streaming first. A cached response
+# is yielded at once, and a stream read to the end is cached.
+def stream_complete(prompt, model=DEFAULT_MODEL, priority=INTERACTIVE, hedge=None, cache=True):
+    key, answer = _cached_response(model, prompt, cache)
+    if answer is not None:
+        yield answer
+        return
+    # Identical streams already in flight are shared, replaying what was streamed so far
+    yield from single_flight.stream(key, lambda: _stream_uncached(key, prompt, model, priority, hedge))
+
+
+def _stream_uncached(key, prompt, model, priority, hedge):
+    if not _should_hedge(hedge, priority):
+        first, stream = _submit(_open_stream, model, prompt, priority, STREAM).result()
+    else:
+        answered_by, (first, stream) = hedged_call(
+            model, lambda candidate: _submit(_open_stream, candidate, prompt, priority, STREAM),
+            _backup_models(prompt), discard=lambda opened: opened[1].close(), kind=STREAM)
+        # A backup's answer is cached as that model's, never as the requested model's
+        key = _cache_key(answered_by, prompt)
+    if first is None:
+        return
+    parts = [first]
+    try:
+        yield first
+        for text in stream:
+            parts.append(text)
+            yield text
+    finally:
+        stream.close()
+    get_response_cache().put(key, "".join(parts))
+
+
+def stream_model(model, query, context="", persona="Professional", cache=True):
+    return stream_complete(build_prompt(query, context, persona), model, cache=cache)
+
+
+# Function to collect the metrics of every layer a model request goes through: scheduler
+# queues per provider, the response cache, coalesced identical requests and hedging
+def gateway_stats():
+    return {
+        "scheduler": get_scheduler().metrics(),
+        "response_cache": get_response_cache().stats(),
+        "single_flight": single_flight.stats(),
+        "hedging": hedge_stats(),
+    }
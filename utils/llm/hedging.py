@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# Send a backup request to a second model when the first one is slow (1 to enable)
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+
+# A request is hedged once it has been waiting longer than this percentile of the model's latency
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+
+# Hedge delay used until a model has enough latency samples, and the smallest hedge delay
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "8.0"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MIN_SAMPLES = 20
+
+# Recent calls per model kept for the latency and error statistics
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+# Models failing more often than this are hedged at once and not used as backups
+LLM_MAX_ERROR_RATE = float(os.getenv("LLM_MAX_ERROR_RATE", "0.5"))
+
+
+# Kinds of latency tracked per model: until a full answer, and until the first streamed
+# token. They differ by the length of the answer, so each kind is hedged on its own samples.
+COMPLETE = "complete"
+STREAM = "stream"
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+
+# Rolling latency and error statistics of every model, fed by each provider call. Latencies
+# are kept per (model, kind); errors per model, whichever kind of call failed.
+class LatencyTracker:
+    def __init__(self, window=LLM_LATENCY_WINDOW):
+        self.window = window
+        self._latencies = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    # Function to record one call; `seconds` is None when the call failed
+    def record(self, model, seconds, kind=COMPLETE):
+        with self._lock:
+            self._errors.setdefault(model, deque(maxlen=self.window)).append(seconds is None)
+            if seconds is not None:
+                self._latencies.setdefault((model, kind), deque(maxlen=self.window)).append(seconds)
+
+    def latency(self, model, percentile, kind=COMPLETE):
+        with self._lock:
+            latencies = list(self._latencies.get((model, kind), ()))
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return _percentile(latencies, percentile)
+
+    def error_rate(self, model):
+        with self._lock:
+            errors = list(self._errors.get(model, ()))
+        return sum(errors) / len(errors) if errors else 0.0
+
+    # Function to compute how long to wait for a model before sending a backup request
+    def hedge_delay(self, model, percentile=LLM_HEDGE_PERCENTILE, kind=COMPLETE):
+        if self.error_rate(model) > LLM_MAX_ERROR_RATE:
+            return 0.0
+        latency = self.latency(model, percentile, kind)
+        if latency is None:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, latency)
+
+    # Function to pick the backup model: the healthy candidate with the lowest median latency
+    def pick_backup(self, candidates, kind=COMPLETE):
+        healthy = [model for model in candidates if self.error_rate(model) <= LLM_MAX_ERROR_RATE]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda model: self.latency(model, 50, kind) or LLM_HEDGE_DEFAULT_DELAY)
+
+    # Function to wrap a provider call so its latency and failures are recorded
+    def timed(self, model, fn, kind=COMPLETE):
+        def call():
+            start = time.perf_counter()
+            try:
+                result = fn()
+            except Exception:
+                self.record(model, None, kind)
+                raise
+            self.record(model, time.perf_counter() - start, kind)
+            return result
+        return call
+
+    # Function to report the error rate per model, with p50/p95/p99 latency per kind of call
+    def stats(self):
+        with self._lock:
+            keys = sorted(self._latencies)
+            models = sorted(set(self._errors) | {model for model, _ in keys})
+        stats = {model: {"error_rate": self.error_rate(model)} for model in models}
+        for model, kind in keys:
+            stats[model][kind] = {f"p{percentile}_seconds": self.latency(model, percentile, kind)
+                                  for percentile in (50, 95, 99)}
+        return stats
+
+
+latency_tracker = LatencyTracker()
+
+_hedge_stats = {"requests": 0, "hedged": 0, "backup_wins": 0, "primary_wins": 0}
+_hedge_lock = threading.Lock()
+
+
+def _count(name):
+    with _hedge_lock:
+        _hedge_stats[name] += 1
+
+
+# Function to discard the result of a request that lost the race, e.g. to close its stream
+def _discard_when_done(future, discard):
+    if future.cancel() or discard is None:
+        return
+    future.add_done_callback(lambda f: discard(f.result()) if f.exception() is None else None)
+
+
+# Function to run a request with hedging. `start(model)` sends the request to a model and
+# returns a concurrent Future. If `model` has not answered within its hedge delay (or fails),
+# the request is also sent to the best of `backups`, the first successful answer wins and the
+# other request is cancelled, or handed to `discard` if it already started.
+# `kind` is the latency the requests are timed by (COMPLETE or STREAM).
+# Returns (model that answered, result).
+def hedged_call(model, start, backups, tracker=latency_tracker, discard=None, kind=COMPLETE):
+    _count("requests")
+    primary = start(model)
+    wait([primary], timeout=tracker.hedge_delay(model, kind=kind))
+    if primary.done() and primary.exception() is None:
+        _count("primary_wins")
+        return model, primary.result()
+
+    backup_model = tracker.pick_backup([backup for backup in backups if backup != model], kind)
+    if backup_model is None:
+        return model, primary.result()
+
+    _count("hedged")
+    pending = {primary: model, start(backup_model): backup_model}
+    error = None
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            answered_by = pending.pop(future)
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            _count("primary_wins" if answered_by == model else "backup_wins")
+            for loser in pending:
+                _discard_when_done(loser, discard)
+            return answered_by, future.result()
+    raise error
+
+
+# Function to report how many requests were hedged and which side answered first
+def hedge_stats():
+    with _hedge_lock:
+        stats = dict(_hedge_stats)
+    stats["hedge_rate"] = stats["hedged"] / stats["requests"] if stats["requests"] else None
+    stats["models"] = latency_tracker.stats()
+    return stats
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Responses kept in memory, and how long a cached response stays valid (0 keeps it forever)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+
+# SQLite file of the disk tier, shared by every process of the app (empty disables it)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+LLM_CACHE_DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "100000"))
+
+
+# Map from hash(provider, model, prompt, generation params) to a model response, held in an
+# in-memory LRU tier backed by an optional SQLite tier, with TTL and size-based eviction
+class ResponseCache:
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL, path=LLM_CACHE_PATH,
+                 disk_max_entries=LLM_CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._disk_entries = 0
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key BLOB PRIMARY KEY, response TEXT NOT NULL, expires REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._connection.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+            self._disk_entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(provider, model, prompt, params=None):
+        payload = json.dumps([provider, model, prompt, params or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).digest()
+
+    def _expires(self):
+        return time.time() + self.ttl if self.ttl > 0 else float("inf")
+
+    # Function to look up a response; returns None on a miss
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, response = entry
+                if expires >= now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return response
+                del self._entries[key]
+
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT response, expires FROM responses WHERE key = ? AND expires >= ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self._remember(key, row[1], row[0])
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        expires = self._expires()
+        with self._lock:
+            self._remember(key, expires, response)
+            if self._connection is not None:
+                cursor = self._connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, expires, last_used) VALUES (?, ?, ?, ?)",
+                    (key, response, min(expires, 1e18), time.time()),
+                )
+                self._disk_entries += max(cursor.rowcount, 0)
+                if self._disk_entries > self.disk_max_entries:
+                    self._evict_disk()
+
+    def _remember(self, key, expires, response):
+        self._entries[key] = (expires, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict_disk(self):
+        self._connection.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+        # Drop an extra 10% so eviction does not run on every insert
+        excess = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - int(self.disk_max_entries * 0.9)
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)", (excess,)
+            )
+        self._disk_entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "disk_entries": self._disk_entries if self._connection is not None else None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else None,
+            }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+# Function to get the response cache shared by every session of the process
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
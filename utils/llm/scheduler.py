@@ -0,0 +1,220 @@
+import asyncio
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Priority lanes: interactive requests are always dispatched before queued bulk work
+INTERACTIVE = 0
+BULK = 1
+
+# Retries of a request that failed with a rate-limit (429), server (5xx) or connection error
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30.0"))
+
+
+# Function to read a provider's limits from the environment, e.g. TOGETHER_RPM=600
+def _provider_limits(provider, requests_per_minute, tokens_per_minute, max_concurrency):
+    prefix = provider.upper()
+    return {
+        "requests_per_minute": float(os.getenv(f"{prefix}_RPM", requests_per_minute)),
+        "tokens_per_minute": float(os.getenv(f"{prefix}_TPM", tokens_per_minute)),
+        "max_concurrency": int(os.getenv(f"{prefix}_MAX_CONCURRENCY", max_concurrency)),
+    }
+
+
+PROVIDER_LIMITS = {
+    "together": _provider_limits("together", 600, 180000, 16),
+    "gemini": _provider_limits("gemini", 1000, 4000000, 16),
+}
+
+
+# Token bucket refilled continuously at `rate_per_minute`, holding at most one minute of budget
+class TokenBucket:
+    def __init__(self, rate_per_minute):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        # A request bigger than the whole bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+# Function to read the HTTP status of a provider error, whichever SDK raised it
+def _status_code(error):
+    for candidate in (error, getattr(error, "response", None)):
+        for attribute in ("status_code", "http_status", "code", "status"):
+            value = getattr(candidate, attribute, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+# Function to get the connection and timeout errors of the HTTP clients and provider SDKs
+# loaded so far. They subclass neither ConnectionError nor TimeoutError and have no status.
+def _transport_errors():
+    errors = [ConnectionError, TimeoutError]
+    for module_name, class_name in (("httpx", "TransportError"), ("together", "APIConnectionError")):
+        module = sys.modules.get(module_name)
+        if module is not None and hasattr(module, class_name):
+            errors.append(getattr(module, class_name))
+    return tuple(errors)
+
+
+def is_retryable(error):
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or 500 <= status < 600
+    return isinstance(error, _transport_errors())
+
+
+# Function to compute how long to wait before retrying: the provider's Retry-After when
+# it sends one, otherwise exponential backoff with full jitter
+def backoff_delay(attempt, error=None):
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+class _ProviderLane:
+    def __init__(self, limits):
+        self.limits = limits
+        self.queue = asyncio.PriorityQueue()
+        self.requests = TokenBucket(limits["requests_per_minute"])
+        self.tokens = TokenBucket(limits["tokens_per_minute"])
+        self.stats = {"queued": {INTERACTIVE: 0, BULK: 0}, "dispatched": 0, "in_flight": 0, "completed": 0, "failed": 0,
+                      "retries": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+
+# Runs provider calls on an asyncio loop in a background thread. Each provider has its
+# own priority queue drained by `max_concurrency` workers, which respect the provider's
+# requests- and tokens-per-minute budgets and retry transient errors with backoff.
+class RequestScheduler:
+    def __init__(self, provider_limits=PROVIDER_LIMITS):
+        self.provider_limits = provider_limits
+        self._lanes = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=sum(limits["max_concurrency"] for limits in provider_limits.values()),
+            thread_name_prefix="llm-call",
+        )
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-scheduler", daemon=True).start()
+            return self._loop
+
+    async def _lane(self, provider):
+        lane = self._lanes.get(provider)
+        if lane is None:
+            lane = self._lanes[provider] = _ProviderLane(self.provider_limits[provider])
+            for _ in range(lane.limits["max_concurrency"]):
+                asyncio.get_running_loop().create_task(self._work(lane))
+        return lane
+
+    async def _enqueue(self, provider, job):
+        lane = await self._lane(provider)
+        lane.stats["queued"][job["priority"]] += 1
+        lane.queue.put_nowait((job["priority"], next(self._sequence), job))
+
+    async def _work(self, lane):
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, _, job = await lane.queue.get()
+            lane.stats["queued"][priority] -= 1
+            future = job["future"]
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                await lane.requests.acquire(1)
+                await lane.tokens.acquire(job["tokens"])
+                if attempt == 0:
+                    lane.stats["dispatched"] += 1
+                    waited = time.monotonic() - job["submitted"]
+                    lane.stats["wait_seconds_total"] += waited
+                    lane.stats["wait_seconds_max"] = max(lane.stats["wait_seconds_max"], waited)
+
+                lane.stats["in_flight"] += 1
+                try:
+                    result = await loop.run_in_executor(self._executor, job["fn"])
+                except Exception as error:
+                    lane.stats["in_flight"] -= 1
+                    if attempt < LLM_MAX_RETRIES and is_retryable(error):
+                        lane.stats["retries"] += 1
+                        await asyncio.sleep(backoff_delay(attempt, error))
+                        continue
+                    lane.stats["failed"] += 1
+                    future.set_exception(error)
+                    break
+                lane.stats["in_flight"] -= 1
+                lane.stats["completed"] += 1
+                future.set_result(result)
+                break
+
+    # Function to schedule `fn()` against a provider; returns a concurrent Future of its result.
+    # `tokens` is the request's estimated size, charged to the tokens-per-minute budget.
+    def submit(self, provider, fn, priority=INTERACTIVE, tokens=0):
+        future = Future()
+        job = {"fn": fn, "future": future, "priority": priority, "tokens": tokens, "submitted": time.monotonic()}
+        asyncio.run_coroutine_threadsafe(self._enqueue(provider, job), self._ensure_loop())
+        return future
+
+    def run(self, provider, fn, priority=INTERACTIVE, tokens=0):
+        return self.submit(provider, fn, priority, tokens).result()
+
+    # Function to report queue depth per lane, requests in flight, retries and queue wait times
+    def metrics(self):
+        metrics = {}
+        for provider, lane in list(self._lanes.items()):
+            stats = lane.stats
+            metrics[provider] = {
+                "queued_interactive": stats["queued"][INTERACTIVE],
+                "queued_bulk": stats["queued"][BULK],
+                "in_flight": stats["in_flight"],
+                "completed": stats["completed"],
+                "failed": stats["failed"],
+                "retries": stats["retries"],
+                "average_wait_seconds": stats["wait_seconds_total"] / stats["dispatched"] if stats["dispatched"] else 0.0,
+                "max_wait_seconds": stats["wait_seconds_max"],
+            }
+        return metrics
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+# Function to get the scheduler shared by every session of the process
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
@@ -0,0 +1,151 @@
+import threading
+from concurrent.futures import Future
+
+_END = object()
+
+
+# A stream read by several callers: every subscriber gets every part from the start, and
+# whichever subscriber needs a part nobody has read yet pulls it from the source, so the
+# stream keeps going as long as anyone is still reading it
+class _SharedStream:
+    def __init__(self, source, on_finish):
+        self._source = source
+        self._on_finish = on_finish
+        self._parts = []
+        self._done = False
+        self._error = None
+        self._fetching = False
+        self._subscribers = 0
+        self._abandoned = False
+        self._condition = threading.Condition()
+
+    # Function to start reading the stream; returns None once every caller has abandoned it
+    def subscribe(self):
+        with self._condition:
+            if self._abandoned:
+                return None
+            self._subscribers += 1
+        return self._iterate()
+
+    def _iterate(self):
+        position = 0
+        try:
+            while True:
+                with self._condition:
+                    while position == len(self._parts) and not self._done and self._fetching:
+                        self._condition.wait()
+                    if position < len(self._parts):
+                        part = self._parts[position]
+                        position += 1
+                    elif self._done:
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    else:
+                        self._fetching = True
+                        part = _END
+                if part is _END:
+                    self._fetch()
+                else:
+                    yield part
+        finally:
+            self._unsubscribe()
+
+    def _fetch(self):
+        try:
+            part = next(self._source, _END)
+        except Exception as error:
+            self._finish(error)
+            raise
+        if part is _END:
+            self._finish(None)
+            return
+        with self._condition:
+            self._parts.append(part)
+            self._fetching = False
+            self._condition.notify_all()
+
+    def _finish(self, error):
+        with self._condition:
+            self._done = True
+            self._error = error
+            self._fetching = False
+            self._condition.notify_all()
+        self._on_finish()
+
+    def _unsubscribe(self):
+        with self._condition:
+            self._subscribers -= 1
+            abandoned = self._subscribers == 0 and not self._done
+            if abandoned:
+                self._done = self._abandoned = True
+        # Nobody is reading any more, so stop the provider stream instead of leaving it open
+        if abandoned:
+            self._on_finish()
+            self._source.close()
+
+
+# Deduplicates identical requests in flight: callers asking for a key that is already
+# being computed wait for that call instead of making their own, and all get its result
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0, "streams": 0, "coalesced_streams": 0}
+
+    # Function to run `fn()` once for all concurrent callers with the same key
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    # Function to stream `open_stream()` once for all concurrent callers with the same key;
+    # a caller joining late still receives the parts streamed before it joined
+    def stream(self, key, open_stream):
+        with self._lock:
+            shared = self._streams.get(key)
+            subscription = shared.subscribe() if shared is not None else None
+            if subscription is None:
+                shared = self._streams[key] = _SharedStream(open_stream(), lambda: self._forget(key, shared))
+                subscription = shared.subscribe()
+                self._stats["streams"] += 1
+            else:
+                self._stats["coalesced_streams"] += 1
+            return subscription
+
+    def _forget(self, key, shared):
+        with self._lock:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    # Function to report how many requests were made and how many attached to one in flight
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls) + len(self._streams)
+        requests = stats["calls"] + stats["coalesced"] + stats["streams"] + stats["coalesced_streams"]
+        stats["coalesced_rate"] = (stats["coalesced"] + stats["coalesced_streams"]) / requests if requests else None
+        return stats
+
+
+single_flight = SingleFlight()
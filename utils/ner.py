@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.llm import BULK, complete
+from utils.text_splitter import TOKENS, split_text
+
+logger = logging.getLogger(__name__)
+
+# Size of the text windows sent to the model, and how much consecutive windows share
+# so an entity cut by one window boundary is whole in the next window
+NER_WINDOW_TOKENS = int(os.getenv("NER_WINDOW_TOKENS", "1500"))
+NER_WINDOW_OVERLAP_TOKENS = int(os.getenv("NER_WINDOW_OVERLAP_TOKENS", "100"))
+
+# Windows processed at the same time
+NER_MAX_CONCURRENCY = int(os.getenv("NER_MAX_CONCURRENCY", "4"))
+
+# Extra attempts for a window whose response is not valid JSON
+NER_MAX_RETRIES = int(os.getenv("NER_MAX_RETRIES", "1"))
+
+NER_PROMPT = '''You are an expert in Named Entity Recognition. Your task is to extract all named entities from the provided text.
+
+Instructions:
+1. Analyze the provided text to identify all named entities.
+2. Give each entity a type such as Person, Organization, Location, Date, Time, Money, Percent, Product, Event or Law.
+3. Copy the text of each entity exactly as it appears in the provided text.
+4. **Respond with only a JSON array like [{{"text": "Barack Obama", "type": "Person"}}], without any additional explanation.** Respond with [] if there are no entities.
+
+Text: {text}'''
+
+
+# Function to cut a document into overlapping windows of at most NER_WINDOW_TOKENS tokens.
+# Yields (start offset, window text).
+def iter_windows(text, window_tokens=NER_WINDOW_TOKENS, overlap_tokens=NER_WINDOW_OVERLAP_TOKENS):
+    for start, end, _ in split_text(text, window_tokens, overlap_tokens, unit=TOKENS):
+        yield start, text[start:end]
+
+
+# Function to read [{"text", "type"}] from a model response; raises ValueError if it is not valid
+def parse_entities(response):
+    match = re.search(r"\[.*\]", response, re.S)
+    if not match:
+        raise ValueError("No JSON array in the response")
+    rows = json.loads(match.group(0))
+    if not isinstance(rows, list):
+        raise ValueError("The response is not a JSON array")
+    return [
+        (row["text"].strip(), row["type"].strip().title())
+        for row in rows
+        if isinstance(row, dict) and isinstance(row.get("text"), str) and isinstance(row.get("type"), str)
+        and row["text"].strip()
+    ]
+
+
+# Function to find every occurrence of an entity in a window, as document offsets. Only
+# whole words match, so "Ann" is not found inside "Annual".
+def _find_mentions(entity, window, window_start):
+    pattern = r"(?<!\w)" + re.escape(entity) + r"(?!\w)"
+    mentions = [(window_start + match.start(), window_start + match.end())
+                for match in re.finditer(pattern, window)]
+    if not mentions:
+        # The model sometimes changes the case of what it copies
+        mentions = [(window_start + match.start(), window_start + match.end())
+                    for match in re.finditer(pattern, window, re.I)]
+    return mentions
+
+
+# Function to extract the entities of one window, with their document offsets.
+# Retries skip the response cache, which would return the same invalid response. A window
+# whose responses all stay invalid is logged and contributes no entities, so one bad
+# response does not fail the whole document.
+def extract_window_entities(window_start, window, model="LLama 3.3 Meta", max_retries=NER_MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        try:
+            entities = parse_entities(complete(NER_PROMPT.format(text=window), model, BULK, cache=attempt == 0))
+            break
+        except ValueError as error:
+            if attempt == max_retries:
+                logger.warning("No entities for the window at offset %d (%d characters): %s",
+                               window_start, len(window), error)
+                return []
+    return [(text, entity_type, _find_mentions(text, window, window_start)) for text, entity_type in entities]
+
+
+# Function to merge the entities found in every window. Entities with the same type and
+# text are one entity; mentions seen by two overlapping windows are counted once.
+def merge_entities(window_results):
+    merged = {}
+    for results in window_results:
+        for text, entity_type, mentions in results:
+            entity = merged.setdefault((entity_type, text.casefold()), {"text": text, "type": entity_type, "mentions": set()})
+            entity["mentions"].update(mentions)
+
+    entities = []
+    for entity in merged.values():
+        entity["mentions"] = sorted(entity["mentions"])
+        entities.append(entity)
+    # Document order; entities the model named but that were not found in the text go last
+    entities.sort(key=lambda entity: entity["mentions"][0][0] if entity["mentions"] else float("inf"))
+    return entities
+
+
+# Function to extract the named entities of a document of any length. Windows are
+# processed concurrently and the result is a list of {"text", "type", "mentions"}, where
+# mentions are (start, end) character offsets into `text`.
+def extract_entities(text, model="LLama 3.3 Meta", max_concurrency=NER_MAX_CONCURRENCY):
+    if not text:
+        return []
+    windows = list(iter_windows(text))
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        window_results = list(executor.map(lambda window: extract_window_entities(*window, model=model), windows))
+    return merge_entities(window_results)
+
+
+# Function to present entities grouped by type, one line per type with quoted entities
+def format_entities(entities):
+    groups = {}
+    for entity in entities:
+        groups.setdefault(entity["type"], []).append(f'"{entity["text"]}"')
+    return "\n\n".join(f"{entity_type}: {', '.join(texts)}" for entity_type, texts in groups.items())
@@ -0,0 +1,140 @@
+import json
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.llm import BULK, complete
+
+SENTIMENT_LABELS = ("positive", "negative", "neutral")
+
+# Texts packed into one prompt, and the character budget of one packed prompt
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "50"))
+SENTIMENT_BATCH_MAX_CHARS = int(os.getenv("SENTIMENT_BATCH_MAX_CHARS", "12000"))
+
+# Packed prompts sent to the provider at the same time
+SENTIMENT_MAX_CONCURRENCY = int(os.getenv("SENTIMENT_MAX_CONCURRENCY", "4"))
+
+# Extra attempts for the rows of a batch that come back missing or malformed
+SENTIMENT_MAX_RETRIES = int(os.getenv("SENTIMENT_MAX_RETRIES", "2"))
+
+
+# Function to classify one text with the LLM
+def analyze_sentiment(text):
+    if text:
+        # Query for sentiment analysis
+        query = f'''You are a sentiment analysis expert. Your task is to analyze the following text and classify its overall sentiment.
+
+        Instructions:
+        1. Read the provided text carefully.
+        2. Identify the dominant emotional tone.
+        3. Classify the sentiment as either positive, negative, or neutral.
+        4. **Provide only the sentiment classification (positive, negative, or neutral) without any additional explanation or analysis.**
+
+        Text: {text}
+
+        Sentiment: '''
+
+        # Send the query to the Llama model for sentiment classification
+        response = complete(query)
+
+        # Parse and return the sentiment result
+        sentiment = response.strip()
+        return sentiment
+
+
+BULK_PROMPT = '''You are a sentiment analysis expert. Classify the overall sentiment of each text below as positive, negative, or neutral.
+
+Instructions:
+1. Each line below is a JSON object with an "id" and a "text".
+2. Classify every text independently.
+3. **Respond with only a JSON array containing one object per text, like [{{"id": 0, "sentiment": "positive"}}], with every id exactly once and no additional explanation.**
+
+Texts:
+{items}'''
+
+
+# Function to build the packed prompt of a batch of (id, text) pairs
+def build_bulk_prompt(batch):
+    items = "\n".join(json.dumps({"id": index, "text": text}, ensure_ascii=False) for index, text in batch)
+    return BULK_PROMPT.format(items=items)
+
+
+# Function to read {id: label} from a model response, ignoring malformed or unknown rows
+def parse_bulk_response(response, ids):
+    match = re.search(r"\[.*\]", response, re.S)
+    if not match:
+        return {}
+    try:
+        rows = json.loads(match.group(0))
+    except ValueError:
+        return {}
+
+    labels = {}
+    for row in rows if isinstance(rows, list) else []:
+        if not isinstance(row, dict):
+            continue
+        index, label = row.get("id"), row.get("sentiment")
+        if isinstance(label, str) and label.strip().lower() in SENTIMENT_LABELS and index in ids:
+            labels[index] = label.strip().lower()
+    return labels
+
+
+# Function to classify one packed batch, re-asking only for the rows that were not answered.
+# Rows still unanswered after the retries are labelled None.
+def classify_batch(batch, model="LLama 3.3 Meta", max_retries=SENTIMENT_MAX_RETRIES):
+    labels = {}
+    remaining = list(batch)
+    for attempt in range(max_retries + 1):
+        # Retries skip the response cache, which would return the same incomplete response
+        response = complete(build_bulk_prompt(remaining), model, BULK, cache=attempt == 0)
+        labels.update(parse_bulk_response(response, {i for i, _ in remaining}))
+        remaining = [(index, text) for index, text in remaining if index not in labels]
+        if not remaining:
+            break
+    return {index: labels.get(index) for index, _ in batch}
+
+
+# Function to pack (id, text) pairs into batches by count and size
+def pack_batches(items, batch_size=SENTIMENT_BATCH_SIZE, max_chars=SENTIMENT_BATCH_MAX_CHARS):
+    batch, chars = [], 0
+    for index, text in items:
+        if batch and (len(batch) == batch_size or chars + len(text) > max_chars):
+            yield batch
+            batch, chars = [], 0
+        batch.append((index, text))
+        chars += len(text)
+    if batch:
+        yield batch
+
+
+# Function to classify many texts. Texts are packed into batches that are sent
+# concurrently, and (index, label) pairs are yielded as each batch finishes, in no
+# particular order. Empty texts are labelled None without calling the model.
+def analyze_sentiment_bulk(texts, model="LLama 3.3 Meta", batch_size=SENTIMENT_BATCH_SIZE,
+                           max_concurrency=SENTIMENT_MAX_CONCURRENCY, max_retries=SENTIMENT_MAX_RETRIES):
+    items = []
+    for index, text in enumerate(texts):
+        text = str(text).strip() if text is not None else ""
+        if text:
+            items.append((index, text))
+        else:
+            yield index, None
+    batches = pack_batches(items, batch_size)
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    try:
+        # Keep only a few batches in flight so huge inputs are not all queued at once
+        pending = set()
+        for batch in batches:
+            pending.add(executor.submit(classify_batch, batch, model, max_retries))
+            if len(pending) < max_concurrency * 2:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result().items()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result().items()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,180 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from utils.embeddings import get_batched_embeddings
+from utils.sentiment import SENTIMENT_LABELS, analyze_sentiment, analyze_sentiment_bulk
+
+# Weights of the local classifier head, trained with `python -m utils.sentiment_classifier`
+SENTIMENT_CLASSIFIER_PATH = os.getenv("SENTIMENT_CLASSIFIER_PATH", os.path.join(".cache", "sentiment_classifier.npz"))
+
+# Predictions less confident than this are sent to the LLM
+SENTIMENT_CONFIDENCE_THRESHOLD = float(os.getenv("SENTIMENT_CONFIDENCE_THRESHOLD", "0.8"))
+
+# Texts embedded and scored locally at a time in bulk mode; their results are yielded
+# before the next slice is embedded
+SENTIMENT_LOCAL_SLICE_SIZE = int(os.getenv("SENTIMENT_LOCAL_SLICE_SIZE", "1024"))
+
+
+# Multinomial logistic regression over sentence embeddings. Texts are embedded without the
+# disk cache: they are mostly seen once and would evict the cached document chunks.
+class SentimentClassifier:
+    def __init__(self, weights, bias, labels=SENTIMENT_LABELS):
+        self.weights = weights
+        self.bias = bias
+        self.labels = tuple(labels)
+
+    @classmethod
+    def fit(cls, vectors, labels, epochs=300, learning_rate=0.5, l2=1e-3):
+        features = np.asarray(vectors, dtype=np.float32)
+        targets = np.zeros((len(labels), len(SENTIMENT_LABELS)), dtype=np.float32)
+        targets[np.arange(len(labels)), [SENTIMENT_LABELS.index(label) for label in labels]] = 1.0
+
+        weights = np.zeros((features.shape[1], len(SENTIMENT_LABELS)), dtype=np.float32)
+        bias = np.zeros(len(SENTIMENT_LABELS), dtype=np.float32)
+        # Full-batch gradient descent; a few thousand labelled texts train in seconds
+        for _ in range(epochs):
+            error = _softmax(features @ weights + bias) - targets
+            weights -= learning_rate * (features.T @ error / len(features) + l2 * weights)
+            bias -= learning_rate * error.mean(axis=0)
+        return cls(weights, bias)
+
+    def predict_proba(self, vectors):
+        return _softmax(np.asarray(vectors, dtype=np.float32) @ self.weights + self.bias)
+
+    # Function to return (label, confidence) for each vector
+    def predict(self, vectors):
+        probabilities = self.predict_proba(vectors)
+        best = probabilities.argmax(axis=1)
+        return [(self.labels[i], float(probabilities[row, i])) for row, i in enumerate(best)]
+
+    def save(self, path=SENTIMENT_CLASSIFIER_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, weights=self.weights, bias=self.bias, labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, path=SENTIMENT_CLASSIFIER_PATH):
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"], [str(label) for label in data["labels"]])
+
+
+def _softmax(logits):
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+# Function to label texts with the LLM, then fit the classifier on their embeddings
+def train_from_llm_labels(texts, path=SENTIMENT_CLASSIFIER_PATH):
+    labelled = [(texts[index], label) for index, label in analyze_sentiment_bulk(texts) if label]
+    vectors = get_batched_embeddings().embed_documents([text for text, _ in labelled])
+    classifier = SentimentClassifier.fit(vectors, [label for _, label in labelled])
+    classifier.save(path)
+    return classifier
+
+
+_classifier = None
+_classifier_loaded = False
+_lock = threading.Lock()
+_stats = {"texts": 0, "local": 0, "llm": 0, "local_seconds": 0.0, "llm_seconds": 0.0}
+
+
+# Function to get the trained classifier, or None when no weights have been saved yet
+def get_classifier():
+    global _classifier, _classifier_loaded
+    with _lock:
+        if not _classifier_loaded:
+            if os.path.exists(SENTIMENT_CLASSIFIER_PATH):
+                _classifier = SentimentClassifier.load(SENTIMENT_CLASSIFIER_PATH)
+            _classifier_loaded = True
+        return _classifier
+
+
+def _record(tier, count, seconds):
+    with _lock:
+        _stats[tier] += count
+        if seconds is not None:
+            _stats[f"{tier}_seconds"] += seconds
+
+
+# Function to classify one text locally and escalate to the LLM when the classifier
+# is missing or not confident enough. Returns (label, tier).
+def classify_sentiment(text, threshold=SENTIMENT_CONFIDENCE_THRESHOLD):
+    if not text:
+        return None, None
+    _record("texts", 1, None)
+    classifier = get_classifier()
+    if classifier is not None:
+        start = time.perf_counter()
+        label, confidence = classifier.predict(get_batched_embeddings().embed_documents([text]))[0]
+        _record("local", 1, time.perf_counter() - start)
+        if confidence >= threshold:
+            return label, "local"
+
+    start = time.perf_counter()
+    label = analyze_sentiment(text).strip().strip('.').lower()
+    _record("llm", 1, time.perf_counter() - start)
+    return label, "llm"
+
+
+# Function to classify many texts: they are scored locally slice by slice, yielding the
+# confident predictions of each slice as it finishes, and only the low-confidence texts go
+# to the bulk LLM path. Empty texts are labelled None and not counted. Yields (index, label, tier).
+def classify_sentiment_bulk(texts, threshold=SENTIMENT_CONFIDENCE_THRESHOLD, slice_size=SENTIMENT_LOCAL_SLICE_SIZE):
+    texts = list(texts)
+    indexes = []
+    for index, text in enumerate(texts):
+        if text.strip():
+            indexes.append(index)
+        else:
+            yield index, None, None
+    _record("texts", len(indexes), None)
+
+    escalated = indexes
+    classifier = get_classifier()
+    if classifier is not None:
+        escalated = []
+        for offset in range(0, len(indexes), slice_size):
+            batch = indexes[offset:offset + slice_size]
+            start = time.perf_counter()
+            predictions = classifier.predict(get_batched_embeddings().embed_documents([texts[index] for index in batch]))
+            _record("local", len(batch), time.perf_counter() - start)
+            for index, (label, confidence) in zip(batch, predictions):
+                if confidence >= threshold:
+                    yield index, label, "local"
+                else:
+                    escalated.append(index)
+
+    start = time.perf_counter()
+    for position, label in analyze_sentiment_bulk([texts[index] for index in escalated]):
+        yield escalated[position], label, "llm"
+    _record("llm", len(escalated), time.perf_counter() - start)
+
+
+# Function to report how many texts were classified, scored locally and escalated to
+# the LLM, the escalation rate and the average latency per text of each tier
+def cascade_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats["escalation_rate"] = stats["llm"] / stats["texts"] if stats["texts"] else None
+    stats["local_ms_per_text"] = 1000 * stats["local_seconds"] / stats["local"] if stats["local"] else None
+    stats["llm_ms_per_text"] = 1000 * stats["llm_seconds"] / stats["llm"] if stats["llm"] else None
+    return stats
+
+
+# Train the classifier head from a CSV/JSONL file of unlabelled texts, labelled by the LLM
+if __name__ == "__main__":
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Train the local sentiment classifier from LLM-labelled texts.")
+    parser.add_argument("file", help="CSV or JSONL file with the training texts")
+    parser.add_argument("--column", default="text", help="column containing the texts")
+    parser.add_argument("--output", default=SENTIMENT_CLASSIFIER_PATH, help="where to save the classifier")
+    args = parser.parse_args()
+
+    table = pd.read_csv(args.file) if args.file.lower().endswith(".csv") else pd.read_json(args.file, lines=True)
+    train_from_llm_labels(table[args.column].fillna('').astype(str).tolist(), args.output)
+    print(f"Saved sentiment classifier to {args.output}")
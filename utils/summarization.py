@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.llm import BULK, build_prompt, call_model, complete, fits_context
+from utils.text_splitter import split_text
+from utils.tokens import estimate_tokens
+
+# Number of chunk summaries requested from the provider at the same time
+SUMMARY_MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", "8"))
+
+# Characters per chunk in the map step; large chunks keep the number of calls low
+SUMMARY_CHUNK_SIZE = int(os.getenv("SUMMARY_CHUNK_SIZE", "8000"))
+SUMMARY_CHUNK_OVERLAP = int(os.getenv("SUMMARY_CHUNK_OVERLAP", "200"))
+
+# Maximum tokens of partial summaries combined into a single reduce call
+SUMMARY_REDUCE_TOKEN_BUDGET = int(os.getenv("SUMMARY_REDUCE_TOKEN_BUDGET", "6000"))
+
+MAP_PROMPT = '''Summarize the following part of a larger document. Keep every main point, key fact, figure and name, and leave out repetition. Respond with the summary only.
+
+Text:
+{text}'''
+
+REDUCE_PROMPT = '''The following are summaries of consecutive parts of one document. Merge them into a single summary that keeps every main point in the original order. Respond with the summary only.
+
+Summaries:
+{text}'''
+
+
+class SummarizationCancelled(Exception):
+    pass
+
+
+# Function to split a document into the chunks summarized in the map step
+def split_for_summary(text):
+    return [text[start:end] for start, end, _ in split_text(text, SUMMARY_CHUNK_SIZE, SUMMARY_CHUNK_OVERLAP)]
+
+
+# Function to group consecutive texts so each group fits the token budget.
+# Every group holds at least two texts, so each reduce level always shrinks the list.
+def group_by_budget(texts, token_budget):
+    groups = []
+    current, current_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if len(current) >= 2 and current_tokens + tokens > token_budget:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if len(current) == 1 and groups:
+        groups[-1].extend(current)
+    elif current:
+        groups.append(current)
+    return groups
+
+
+# Function to run one prompt per text on a bounded thread pool, keeping the input order.
+# Progress is reported from the calling thread, so Streamlit elements can be updated from it.
+def _summarize_all(texts, prompt, model, max_workers, stage, on_progress, cancel_event):
+    results = [None] * len(texts)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {executor.submit(complete, prompt.format(text=text), model, BULK): i for i, text in enumerate(texts)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            if cancel_event is not None and cancel_event.is_set():
+                raise SummarizationCancelled()
+            for future in done:
+                results[futures[future]] = future.result()
+            if on_progress and done:
+                on_progress(stage, len(texts) - len(pending), len(texts))
+    finally:
+        # On errors, cancellation or a Streamlit rerun, drop the chunks that have not started yet
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+# Function to summarize a long document with map-reduce:
+# 1. every chunk is summarized concurrently (map),
+# 2. partial summaries are merged group by group until they fit the token budget (reduce),
+# 3. the selected model writes the final summary from them with the user's persona.
+# `on_progress(stage, done, total)` is called as calls finish; setting `cancel_event` stops the run.
+def map_reduce_summarize(chunks, model, query, persona="Professional", max_workers=SUMMARY_MAX_WORKERS,
+                         token_budget=SUMMARY_REDUCE_TOKEN_BUDGET, on_progress=None, cancel_event=None):
+    summaries = _summarize_all(chunks, MAP_PROMPT, model, max_workers, "Summarizing sections", on_progress, cancel_event)
+
+    level = 1
+    while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > token_budget:
+        groups = ["\n\n".join(group) for group in group_by_budget(summaries, token_budget)]
+        summaries = _summarize_all(groups, REDUCE_PROMPT, model, max_workers, f"Combining summaries (level {level})",
+                                   on_progress, cancel_event)
+        level += 1
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise SummarizationCancelled()
+    return call_model(model, query, "\n\n".join(summaries), persona)
+
+
+# Function to summarize a text of any size. Texts that fit the model's context window
+# are sent in a single call; longer ones go through map-reduce.
+def summarize(text, model, query, persona="Professional", on_progress=None, cancel_event=None):
+    if fits_context(model, build_prompt(query, text, persona)):
+        return call_model(model, query, text, persona)
+
+    chunks = split_for_summary(text)
+    return map_reduce_summarize(chunks, model, query, persona, on_progress=on_progress, cancel_event=cancel_event)
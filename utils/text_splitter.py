@@ -0,0 +1,199 @@
+import argparse
+import multiprocessing
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.tokens import CHARS_PER_TOKEN, count_tokens
+
+# Units chunk sizes can be given in
+CHARS = "chars"
+TOKENS = "tokens"
+
+# Boundaries a chunk may end on, best first: paragraph, line, sentence, word. A chunk
+# is cut in the middle of a word only when its text has no whitespace at all.
+_BOUNDARIES = (("\n\n",), ("\n",), (". ", "? ", "! "), (" ", "\t"))
+
+_NON_SPACE = re.compile(r"\S")
+
+# Token counts above the limit shrink a chunk and are counted again at most this often
+_MAX_TOKEN_PASSES = 4
+
+
+# Function to find the last boundary of the best kind between `low` and `high`; returns
+# the offset just after it, or None when there is no boundary at all
+def _last_boundary(text, low, high):
+    for separators in _BOUNDARIES:
+        positions = [position + len(separator) for separator in separators
+                     if (position := text.rfind(separator, low, high)) >= 0]
+        if positions:
+            return max(positions)
+    return None
+
+
+# Function to find the first boundary of the best kind between `low` and `high`
+def _first_boundary(text, low, high):
+    for separators in _BOUNDARIES:
+        positions = [position + len(separator) for separator in separators
+                     if (position := text.find(separator, low, high)) >= 0]
+        if positions:
+            return min(positions)
+    return None
+
+
+def _strip(text, start, end):
+    match = _NON_SPACE.search(text, start, end)
+    if match is None:
+        return end, end
+    start = match.start()
+    while text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+# Function to choose the end of the chunk starting at `start`, at most `size` characters
+# on, preferring a boundary in the second half of the chunk
+def _chunk_end(text, start, stop, size):
+    limit = start + size
+    if limit >= stop:
+        return stop
+    end = _last_boundary(text, start + size // 2, limit)
+    return limit if end is None else end
+
+
+# Function to cut the chunk starting at `start` of a text that is available up to `stop`.
+# Returns (chunk start, chunk end, start of the next chunk); the chunk offsets leave out
+# surrounding whitespace and may be equal when the chunk is blank.
+def _cut(text, start, stop, chunk_size, chunk_overlap, unit):
+    if unit == TOKENS:
+        size = chunk_size * CHARS_PER_TOKEN
+        overlap = chunk_overlap * CHARS_PER_TOKEN
+        for _ in range(_MAX_TOKEN_PASSES):
+            end = _chunk_end(text, start, stop, size)
+            tokens = count_tokens(text[start:end])
+            if tokens <= chunk_size:
+                break
+            size = max(1, int((end - start) * chunk_size / tokens * 0.9))
+    else:
+        overlap = chunk_overlap
+        end = _chunk_end(text, start, stop, chunk_size)
+
+    chunk_start, chunk_end = _strip(text, start, end)
+    if end >= stop:
+        next_start = stop
+    else:
+        # The next chunk starts on a boundary inside the overlap, so it does not begin
+        # mid-word. The boundary the chunk ends on is left out, or the chunks would not
+        # overlap at all; a boundary keeping at least half the overlap is preferred.
+        low = max(start + 1, end - overlap)
+        next_start = _first_boundary(text, low, max(low, chunk_end - overlap // 2))
+        if next_start is None:
+            next_start = _first_boundary(text, low, chunk_end)
+        if next_start is None:
+            next_start = max(start + 1, end - overlap)
+    return chunk_start, chunk_end, next_start
+
+
+# Function to split a text into overlapping chunks in linear time, without copying it.
+# Sizes are in characters or, with unit=TOKENS, in tokens (the overlap is approximate).
+# Chunks end on a paragraph, line, sentence or word boundary, in that order of preference,
+# and never go over the size. Yields (start, end, page) records; the text of a chunk is
+# text[start:end].
+def split_text(text, chunk_size=1000, chunk_overlap=200, unit=CHARS, page=None):
+    start = 0
+    while start < len(text):
+        chunk_start, chunk_end, start = _cut(text, start, len(text), chunk_size, chunk_overlap, unit)
+        if chunk_end > chunk_start:
+            yield chunk_start, chunk_end, page
+
+
+# Function to split a stream of (page, text) segments into overlapping chunks like
+# split_text, holding only the text not chunked yet. Yields (text, (start, end, page))
+# with offsets in the whole document and the page the chunk starts on.
+def iter_chunks(segments, chunk_size=1000, chunk_overlap=200, unit=CHARS):
+    # Characters a chunk can span, plus room to see the boundary after it
+    lookahead = (chunk_size * (CHARS_PER_TOKEN if unit == TOKENS else 1)) + 2
+    buffer = ""
+    base = 0
+    position = 0
+    page_starts = deque()
+
+    def page_at(offset):
+        while len(page_starts) > 1 and page_starts[1][0] <= offset:
+            page_starts.popleft()
+        return page_starts[0][1] if page_starts else None
+
+    def cut(final):
+        nonlocal buffer, base, position
+        while position < len(buffer) and (final or len(buffer) - position > lookahead):
+            chunk_start, chunk_end, position = _cut(buffer, position, len(buffer), chunk_size, chunk_overlap, unit)
+            if chunk_end > chunk_start:
+                yield buffer[chunk_start:chunk_end], (base + chunk_start, base + chunk_end, page_at(base + chunk_start))
+        # Drop the chunked text once it is most of the buffer, so each character is copied a few times at most
+        if position > len(buffer) // 2:
+            buffer = buffer[position:]
+            base += position
+            position = 0
+
+    for page, text in segments:
+        if text:
+            page_starts.append((base + len(buffer), page))
+            buffer += text
+            yield from cut(final=False)
+    yield from cut(final=True)
+
+
+def _sample_text(megabytes, newlines=True):
+    sentence = "The quarterly report covers revenue, costs and the outlook for the next year. "
+    paragraph = sentence * 6 + ("\n\n" if newlines else "")
+    return paragraph * (megabytes * 2 ** 20 // len(paragraph))
+
+
+def _langchain_chunks(text, chunk_size, chunk_overlap):
+    from langchain.text_splitter import CharacterTextSplitter
+    splitter = CharacterTextSplitter(separator="\n", chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                     length_function=len)
+    return [len(chunk) for chunk in splitter.split_text(text)]
+
+
+def _offset_chunks(text, chunk_size, chunk_overlap):
+    return [end - start for start, end, _ in split_text(text, chunk_size, chunk_overlap)]
+
+
+# Function to time one splitter in a fresh process, with the growth of its peak memory
+def _benchmark_splitter(name, megabytes, newlines, chunk_size, chunk_overlap):
+    import logging
+    import resource
+    # The langchain splitter warns about every oversized chunk
+    logging.disable(logging.WARNING)
+    splitters = {"langchain": _langchain_chunks, "offsets": _offset_chunks}
+    text = _sample_text(megabytes, newlines)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    lengths = splitters[name](text, chunk_size, chunk_overlap)
+    seconds = time.perf_counter() - start
+    return {"splitter": name, "seconds": seconds, "chunks": len(lengths), "largest": max(lengths),
+            "peak_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024}
+
+
+# Compare split_text with langchain's CharacterTextSplitter on a synthetic text: time,
+# number of chunks, the largest chunk and the peak memory each adds to a fresh process
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark text splitting.")
+    parser.add_argument("--megabytes", type=int, default=100, help="size of the synthetic text")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=200, help="characters shared by consecutive chunks")
+    parser.add_argument("--no-newlines", action="store_true", help="use a text without line breaks")
+    args = parser.parse_args()
+
+    print(f"{args.megabytes} MB {'without' if args.no_newlines else 'with'} newlines, "
+          f"chunks of {args.chunk_size} characters overlapping by {args.chunk_overlap}")
+    print(f"{'splitter':<12}{'seconds':>9}{'MB/s':>8}{'chunks':>10}{'largest':>12}{'peak MB':>9}")
+    context = multiprocessing.get_context("spawn")
+    for name in ("langchain", "offsets"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            row = pool.submit(_benchmark_splitter, name, args.megabytes, not args.no_newlines,
+                              args.chunk_size, args.chunk_overlap).result()
+        print(f"{row['splitter']:<12}{row['seconds']:>9.2f}{args.megabytes / row['seconds']:>8.1f}"
+              f"{row['chunks']:>10}{row['largest']:>12}{row['peak_mb']:>9.0f}")
@@ -0,0 +1,63 @@
+import argparse
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Average number of characters per token for English text with the models we use
+CHARS_PER_TOKEN = 4
+
+# tiktoken encoding used to count tokens exactly when tiktoken is installed. Llama 3 uses
+# a tiktoken vocabulary, and cl100k_base counts within a few percent of it.
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# tiktoken downloads the vocabulary of an encoding on first use and keeps it in this
+# directory. Fetch it ahead of time with `python -m utils.tokens` on hosts without
+# internet access, or copy the directory there.
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR", os.path.join(".cache", "tiktoken"))
+
+_encoding = None
+_encoding_loaded = False
+_lock = threading.Lock()
+
+
+# Function to estimate the number of tokens of a text without loading a tokenizer
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# Function to get the tokenizer, or None when tiktoken or its vocabulary is not available
+def get_encoding():
+    global _encoding, _encoding_loaded
+    with _lock:
+        if not _encoding_loaded:
+            try:
+                os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as error:
+                # Not installed, or the vocabulary could not be downloaded
+                logger.warning("Tokenizer %s is not available (%s); token counts are estimated. Install tiktoken "
+                               "and run `python -m utils.tokens` to fetch its vocabulary", TOKENIZER_ENCODING, error)
+            _encoding_loaded = True
+        return _encoding
+
+
+# Function to count the tokens of a text with the tokenizer, falling back to the estimate
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# Fetch the tokenizer vocabulary into TIKTOKEN_CACHE_DIR, e.g. while building a deployment;
+# exits with 1 when it cannot be loaded
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the tokenizer vocabulary used to count prompt tokens.")
+    parser.parse_args()
+    encoding = get_encoding()
+    if encoding is None:
+        raise SystemExit(1)
+    print(f"{TOKENIZER_ENCODING}: {encoding.n_vocab} tokens, cached in {os.environ['TIKTOKEN_CACHE_DIR']}")
@@ -0,0 +1,83 @@
+import time
+
+import streamlit as st
+
+from utils.chat_history import CHAT_HISTORY_PAGE_SIZE
+
+# Minimum seconds between two redraws of a streaming message
+STREAM_REFRESH_INTERVAL = 0.05
+
+
+# Function to render a token stream incrementally into a placeholder.
+# `render` draws the text so far (e.g. a chat bubble); the full text is returned at the end.
+def render_stream(stream, render, placeholder=None):
+    placeholder = placeholder or st.empty()
+    parts = []
+    last_refresh = 0.0
+    for token in stream:
+        parts.append(token)
+        now = time.monotonic()
+        if now - last_refresh >= STREAM_REFRESH_INTERVAL:
+            with placeholder.container():
+                render("".join(parts) + "▌")
+            last_refresh = now
+
+    text = "".join(parts)
+    with placeholder.container():
+        render(text)
+    return text
+
+
+# Function to show the latest exchanges of a chat history, with a button that shows
+# earlier ones page by page. Only the visible messages are drawn, so a rerun costs the
+# same however long the conversation is.
+def render_chat_history(history, display_user_message, display_ai_message, key):
+    visible_key = f"{key}_visible"
+    if visible_key not in st.session_state:
+        st.session_state[visible_key] = CHAT_HISTORY_PAGE_SIZE
+
+    def load_earlier():
+        st.session_state[visible_key] += CHAT_HISTORY_PAGE_SIZE
+
+    visible = st.session_state[visible_key]
+    if len(history) > visible:
+        st.button(f"Load earlier messages ({len(history) - visible} more)", key=f"{key}_load_earlier",
+                  on_click=load_earlier)
+    else:
+        display_user_message(history.greeting[0])
+        display_ai_message(history.greeting[1])
+
+    for query, answer in history.latest(visible):
+        display_user_message(query)
+        display_ai_message(answer)
+
+
+# Function to empty a chat history and show its first page again
+def clear_chat(history, key):
+    history.clear()
+    st.session_state[f"{key}_visible"] = CHAT_HISTORY_PAGE_SIZE
+
+
+# Function to show how model requests are doing across every session of the process:
+# queue depth and wait per provider, response cache hits, coalesced duplicates and hedging
+def render_llm_stats():
+    from utils.llm import gateway_stats
+    stats = gateway_stats()
+    with st.sidebar.expander("Model Requests"):
+        for provider, lane in stats["scheduler"].items():
+            st.write(f"{provider.title()}: {lane['queued_interactive']} interactive and {lane['queued_bulk']} bulk "
+                     f"requests queued, {lane['in_flight']} in flight, waited {lane['average_wait_seconds']:.2f} s "
+                     f"on average (max {lane['max_wait_seconds']:.1f} s), {lane['retries']} retries, "
+                     f"{lane['failed']} failed")
+        cache = stats["response_cache"]
+        if cache["hit_rate"] is not None:
+            st.write(f"Response cache: {cache['hit_rate']:.0%} hits ({cache['memory_hits']} in memory, "
+                     f"{cache['disk_hits']} on disk, {cache['misses']} misses)")
+        coalescing = stats["single_flight"]
+        if coalescing["coalesced_rate"] is not None:
+            st.write(f"Shared with an identical request in flight: {coalescing['coalesced_rate']:.0%} "
+                     f"({coalescing['coalesced'] + coalescing['coalesced_streams']} requests)")
+        hedging = stats["hedging"]
+        if hedging["hedge_rate"] is not None:
+            st.write(f"Hedged: {hedging['hedge_rate']:.0%} of {hedging['requests']} requests "
+                     f"(the backup model answered first for {hedging['backup_wins']})")